@@ -1,13 +1,23 @@
 from abc import ABC, abstractmethod
-from itertools import combinations
+from bitmask_utils import ALL_DIGITS, DIGIT_MASKS, LOWEST_DIGIT, MASK_DIGITS, MASK_SUM, POPCOUNT, digits_to_mask
 from enums import ConstraintsEnum, KropkiTypeEnum
 
 class Constraint(ABC):
 
     _id_counter = 0
 
+    #True if propagate() reads the candidates of its cells, so it must be re-run whenever they shrink.
+    #Constraints that only look at placed values are only re-run when one of their cells is filled
+    watches_candidates = True
+
+    #True if a single propagate() call leaves the constraint at its own fixpoint, so the candidate changes
+    #it makes do not need to wake it again
+    idempotent = False
+
     def __init__(self, cells):
         self.affected_cells = cells # List of cells affected by the constraint
+        self.cell_indices = tuple(cell.index for cell in cells) # Positions of the cells in the board's flat arrays
+        self.board = cells[0].board if cells else None
         self.constraint_id = Constraint._id_counter
         Constraint._id_counter += 1
 
@@ -19,72 +29,97 @@ class Constraint(ABC):
     @abstractmethod
     def propagate(self):
         #Removes impossible values from affected cells based on current values
+        #Returns False if an empty cell was left without any possible value
         pass
 
-class RowConstraint(Constraint):
+    def cache_key(self):
+        #Identifies the rule the constraint adds to the puzzle, equal for equal constraints on any board.
+        #Cell order is ignored unless the constraint depends on it
+        return (type(self).__name__,) + tuple(sorted(self.cell_indices))
+
+class UniqueDigitsConstraint(Constraint):
+    #Shared logic for constraints whose cells may not repeat a digit
+    watches_candidates = False
+
     def __init__(self, cells):
         super().__init__(cells)
 
     def verify_constraint(self):
-        #Numbers within row must not repeat
-        nums_seen = [cell.value for cell in self.affected_cells if cell.value != 0]
-        set_nums_seen = set(nums_seen)
+        values = self.board.values
+        seen = 0
+        for index in self.cell_indices:
+            digit_mask = DIGIT_MASKS[values[index]]
+            if seen & digit_mask:
+                return False
+            seen |= digit_mask
+        return True
 
-        return len(nums_seen) == len(set_nums_seen)
-    
     def propagate(self):
         #Seen nums can be removed from possible values of other affected cells
-        nums_seen = [cell.value for cell in self.affected_cells if cell.value != 0]
-        for cell in self.affected_cells:
-            if cell.value == 0:
-                cell.possible_values -= set(nums_seen)
+        board = self.board
+        values = board.values
+        candidates = board.candidates
+
+        #A digit placed twice breaks the constraint straight away, there is no need to wait for a full board
+        seen = 0
+        for index in self.cell_indices:
+            digit_mask = DIGIT_MASKS[values[index]]
+            if seen & digit_mask:
+                return False
+            seen |= digit_mask
+        if seen == 0:
+            return True
+
+        for index in self.cell_indices:
+            if values[index] == 0 and candidates[index] & seen:
+                remaining = candidates[index] & ~seen
+                board.set_candidates(index, remaining)
+                if remaining == 0:
+                    return False
+        return True
 
-class ColumnConstraint(Constraint):
+class RowConstraint(UniqueDigitsConstraint):
+    #Numbers within row must not repeat
     def __init__(self, cells):
         super().__init__(cells)
 
-    def verify_constraint(self):
-        #Numbers within column must not repeat
-        nums_seen = [cell.value for cell in self.affected_cells if cell.value != 0]
-        set_nums_seen = set(nums_seen)
+class ColumnConstraint(UniqueDigitsConstraint):
+    #Numbers within column must not repeat
+    def __init__(self, cells):
+        super().__init__(cells)
 
-        return len(nums_seen) == len(set_nums_seen)
-    
-    def propagate(self):
-        #Seen nums can be removed from possible values of other affected cells
-        nums_seen = [cell.value for cell in self.affected_cells if cell.value != 0]
-        for cell in self.affected_cells:
-            if cell.value == 0:
-                cell.possible_values -= set(nums_seen)
-                
-class BoxConstraint(Constraint):
+class BoxConstraint(UniqueDigitsConstraint):
+    #Numbers within box must not repeat
     def __init__(self, cells):
         super().__init__(cells)
 
-    def verify_constraint(self):
-        #Numbers within box must not repeat
-        nums_seen = [cell.value for cell in self.affected_cells if cell.value != 0]
-        set_nums_seen = set(nums_seen)
+#(number of cells, sum) -> masks of every set of distinct digits with that size and sum, built once for all cages
+CAGE_COMBINATIONS = {}
+for _mask in range(1, ALL_DIGITS + 1):
+    CAGE_COMBINATIONS.setdefault((POPCOUNT[_mask], MASK_SUM[_mask]), []).append(_mask)
+del _mask
 
-        return len(nums_seen) == len(set_nums_seen)
-    
-    def propagate(self):
-        #Seen nums can be removed from possible values of other affected cells
-        nums_seen = [cell.value for cell in self.affected_cells if cell.value != 0]
-        for cell in self.affected_cells:
-            if cell.value == 0:
-                cell.possible_values -= set(nums_seen)
+#Mask of the digits from low to high inclusive, empty when low > high
+DIGIT_RANGE_MASKS = [[ALL_DIGITS & ~((1 << (low - 1)) - 1) & ((1 << high) - 1) if 1 <= low <= high else 0
+                      for high in range(10)] for low in range(10)]
+
+class KillerCageConstraint(UniqueDigitsConstraint):
+    #Reads candidates to match them against the possible combinations, so it has to be woken when they shrink
+    watches_candidates = True
 
-class KillerCageConstraint(Constraint):
     def __init__(self, cells, target):
         super().__init__(cells)
         self.target_sum = target
         self.cells_in_cage = len(cells)
-        self.possible_sums = self.find_possible_sums(target, self.cells_in_cage)
+        self.possible_sum_masks = CAGE_COMBINATIONS.get((self.cells_in_cage, target), [])
+        self.possible_sums = [set(MASK_DIGITS[mask]) for mask in self.possible_sum_masks]
+
+    def cache_key(self):
+        return (type(self).__name__, self.target_sum) + tuple(sorted(self.cell_indices))
 
     def find_possible_sums(self, target, num_cells):
         #Return a list of sets of possible combinations that add up to target sum
-        return [set(combo) for combo in combinations(range(1,10), num_cells) if sum(combo) == target]
+        return [set(MASK_DIGITS[mask]) for mask in CAGE_COMBINATIONS.get((num_cells, target), [])]
 
 
     def verify_constraint(self):
@@ -94,17 +129,23 @@ class KillerCageConstraint(Constraint):
         # 3. If not all cells are filled, the current sum does not exceed target sum
         # 4. The combination of numbers in the cage are part of a possible sum to the target sum
         # Return true if all conditions are met, else false
+        values = self.board.values
 
         #Numbers within killer cage must not repeat and must add up to target sum
-        nums_seen = [cell.value for cell in self.affected_cells if cell.value != 0]
-        set_nums_seen = set(nums_seen)
+        seen = 0
+        num_filled = 0
+        current_sum = 0
+        for index in self.cell_indices:
+            value = values[index]
+            if value != 0:
+                #Check to ensure there are no repeating digits
+                if seen & DIGIT_MASKS[value]:
+                    return False
+                seen |= DIGIT_MASKS[value]
+                num_filled += 1
+                current_sum += value
 
-        #Check to ensure there are no repeating digits
-        if len(nums_seen) != len(set_nums_seen):
-            return False
-        
-        current_sum = sum(nums_seen)
-        if len(nums_seen) == len(self.affected_cells):
+        if num_filled == self.cells_in_cage:
             #All cells filled, check if sum matches target
             if current_sum != self.target_sum:
                 return False
@@ -112,38 +153,160 @@ class KillerCageConstraint(Constraint):
             #Not all cells filled, check if current sum exceeds target
             if current_sum >= self.target_sum:
                 return False
-            
-        is_possible_sum = [set_nums_seen.issubset(p) for p in self.possible_sums]
+
+        is_possible_sum = [seen & mask == seen for mask in self.possible_sum_masks]
         if not any(is_possible_sum):
             return False
-        
+
         return True
-        
 
-        
-    
     def propagate(self):
         #Seen nums can be removed from possible values of other affected cells
-        nums_seen = [cell.value for cell in self.affected_cells if cell.value != 0]
-        for cell in self.affected_cells:
-            if cell.value == 0:
-                cell.possible_values -= set(nums_seen)
+        if super().propagate() is False:
+            return False
 
-        #TO-DO: Additional logic to limit possible values based on target sum can be added here
-        #   Nums seen must be a part of a summation to the target sum, so then remaining possible values
-        #   can be found from the possible summations that include the nums seen.
+        board = self.board
+        values = board.values
+        candidates = board.candidates
 
-class KropkiDotConstraint(Constraint):
-    def __init__(self, cells, type):
+        placed = 0
+        remaining_sum = self.target_sum
+        empty_cells = []
+        for index in self.cell_indices:
+            if values[index] != 0:
+                placed |= DIGIT_MASKS[values[index]]
+                remaining_sum -= values[index]
+            else:
+                empty_cells.append(index)
+        if not empty_cells:
+            return True
+
+        #Nums seen must be part of a combination adding up to the target sum, and every empty cell must be able
+        #to take one of the digits the combination still needs. The union of those digits is all the cells can hold
+        allowed = 0
+        for combo_mask in self.possible_sum_masks:
+            if combo_mask & placed != placed:
+                continue
+            needed = combo_mask & ~placed
+            for index in empty_cells:
+                if not candidates[index] & needed:
+                    break
+            else:
+                allowed |= needed
+        if allowed == 0:
+            return False
+
+        #Sum bounds: a cell can only take v if the other empty cells can make up remaining_sum - v
+        #with their smallest and largest candidates
+        min_total = 0
+        max_total = 0
+        for index in empty_cells:
+            mask = candidates[index] & allowed
+            min_total += LOWEST_DIGIT[mask]
+            max_total += mask.bit_length()
+
+        for index in empty_cells:
+            mask = candidates[index] & allowed
+            low = max(remaining_sum - (max_total - mask.bit_length()), 1)
+            high = min(remaining_sum - (min_total - LOWEST_DIGIT[mask]), 9)
+            mask &= DIGIT_RANGE_MASKS[low][high] if low <= high else 0
+            if mask == 0:
+                return False
+            if mask != candidates[index]:
+                board.set_candidates(index, mask)
+        return True
+
+def build_support_table(relation):
+    #support[mask] is the mask of digits b for which relation(a, b) holds for at least one digit a of the mask
+    return [
+        digits_to_mask([b for b in range(1, 10) if any(relation(a, b) for a in MASK_DIGITS[mask])])
+        for mask in range(ALL_DIGITS + 1)
+    ]
+
+#Support tables are built once per relation and shared by every constraint using it
+_SUPPORT_TABLES = {}
+
+def get_support_tables(relation_name, relation):
+    #(forward, backward): forward maps the first cell's candidates to the digits they allow in the second cell,
+    #backward the other way round
+    if relation_name not in _SUPPORT_TABLES:
+        forward = build_support_table(relation)
+        backward = build_support_table(lambda b, a: relation(a, b))
+        #Symmetric relations share one table
+        _SUPPORT_TABLES[relation_name] = (forward, forward if backward == forward else backward)
+    return _SUPPORT_TABLES[relation_name]
+
+class BinaryConstraint(Constraint):
+    #Arc consistency for any relation between two cells. Revising an arc is two table lookups, and the board's
+    #work queue re-runs every constraint watching a cell whose candidates shrank, which together is AC-3.
+    #With bitmask domains a support is found in O(1), so AC-2001's last-support bookkeeping has nothing to save
+    idempotent = True
+
+    def __init__(self, cells, relation_name, relation):
         super().__init__(cells)
+        self.relation = relation
+        self.relation_name = relation_name
+        self.forward_support, self.backward_support = get_support_tables(relation_name, relation)
+
+    def cache_key(self):
+        #Symmetric relations share one table for both directions, so the cell order only matters otherwise
+        cell_indices = self.cell_indices
+        if self.forward_support is self.backward_support:
+            cell_indices = tuple(sorted(cell_indices))
+        return (type(self).__name__, self.relation_name) + cell_indices
+
+    def verify_constraint(self):
+        val1 = self.board.values[self.cell_indices[0]]
+        val2 = self.board.values[self.cell_indices[1]]
+        if val1 == 0 or val2 == 0:
+            return True # Cannot verify yet
+        return self.relation(val1, val2)
+
+    def propagate(self):
+        #Revise both arcs. The second revision cannot remove the support of anything left in the first cell,
+        #so the pair is arc consistent after a single pass
+        board = self.board
+        values = board.values
+        candidates = board.candidates
+        index1, index2 = self.cell_indices
+
+        #Two placed digits breaking the relation fail before any candidates are touched
+        if values[index1] != 0 and values[index2] != 0:
+            return self.relation(values[index1], values[index2])
+
+        mask1 = candidates[index1] & self.backward_support[candidates[index2]]
+        if mask1 == 0:
+            return False
+        if values[index1] == 0 and mask1 != candidates[index1]:
+            board.set_candidates(index1, mask1)
+
+        mask2 = candidates[index2] & self.forward_support[mask1]
+        if mask2 == 0:
+            return False
+        if values[index2] == 0 and mask2 != candidates[index2]:
+            board.set_candidates(index2, mask2)
+        return True
+
+def is_consecutive(a, b):
+    return abs(a - b) == 1
+
+def is_double(a, b):
+    return a == 2 * b or b == 2 * a
+
+class KropkiDotConstraint(BinaryConstraint):
+    def __init__(self, cells, type):
+        if type == KropkiTypeEnum.WHITE_DOT:
+            super().__init__(cells, type.value, is_consecutive)
+        else:
+            super().__init__(cells, type.value, is_double)
         self.type = type # 'white' or 'black'
 
     def verify_constraint(self):
         # Need to verify
         # 1. For white dot, numbers must be consecutive
         # 2. For black dot, one number must be double the other
-        val1 = self.affected_cells[0].value
-        val2 = self.affected_cells[1].value
+        val1 = self.board.values[self.cell_indices[0]]
+        val2 = self.board.values[self.cell_indices[1]]
 
         if self.type == KropkiTypeEnum.WHITE_DOT:
             if val1 == 0 or val2 == 0:
@@ -156,51 +319,3 @@ class KropkiDotConstraint(Constraint):
             if val1 == 0 or val2 == 0:
                 return True # Cannot verify yet
             return (val1 == 2 * val2) or (val2 == 2 * val1)
-    
-    def propagate(self):
-        if self.type == KropkiTypeEnum.WHITE_DOT:
-            # For white dot, possible values must be consecutive
-            cell1, cell2 = self.affected_cells
-            if cell1.value == 0 and cell2.value == 0:
-                new_possibles1 = set()
-                new_possibles2 = set()
-                for val in cell1.possible_values:
-                    if val + 1 in cell2.possible_values:
-                        new_possibles1.add(val)
-                        new_possibles2.add(val + 1)
-                    if val - 1 in cell2.possible_values:
-                        new_possibles1.add(val)
-                        new_possibles2.add(val - 1)
-                cell1.possible_values = new_possibles1
-                cell2.possible_values = new_possibles2
-            elif cell1.value == 0:
-                cell1.possible_values = {cell2.value - 1, cell2.value + 1} & cell1.possible_values
-            elif cell2.value == 0:
-                cell2.possible_values = {cell1.value - 1, cell1.value + 1} & cell2.possible_values
-        elif self.type == KropkiTypeEnum.BLACK_DOT:
-            # For black dot, one number must be double the other
-            cell1, cell2 = self.affected_cells
-            if cell1.value == 0 and cell2.value == 0:
-                new_possibles1 = set()
-                new_possibles2 = set()
-                for val in cell1.possible_values:
-                    if val * 2 in cell2.possible_values:
-                        new_possibles1.add(val)
-                        new_possibles2.add(val * 2)
-                    if val % 2 == 0 and (val // 2) in cell2.possible_values:
-                        new_possibles1.add(val)
-                        new_possibles2.add(val // 2)
-                cell1.possible_values = new_possibles1
-                cell2.possible_values = new_possibles2
-            elif cell1.value == 0:
-                possible_vals = set()
-                if cell2.value % 2 == 0:
-                    possible_vals.add(cell2.value // 2)
-                possible_vals.add(cell2.value * 2)
-                cell1.possible_values = possible_vals & cell1.possible_values
-            elif cell2.value == 0:
-                possible_vals = set()
-                if cell1.value % 2 == 0:
-                    possible_vals.add(cell1.value // 2)
-                possible_vals.add(cell1.value * 2)
-                cell2.possible_values = possible_vals & cell2.possible_values
\ No newline at end of file
@@ -0,0 +1,225 @@
+from bitmask_utils import DIGIT_MASKS, MASK_DIGITS
+from Constraints import BoxConstraint, ColumnConstraint, KillerCageConstraint, RowConstraint
+from SudokuBoard import CELL_BOX, CELL_COL, CELL_ROW
+
+#Constraint types that can be expressed as exact cover columns
+SUPPORTED_CONSTRAINTS = (RowConstraint, ColumnConstraint, BoxConstraint, KillerCageConstraint)
+
+
+class DancingLinks():
+    #Knuth's Algorithm X on a sparse 0/1 matrix stored as circular doubly linked lists in flat arrays.
+    #Node 0 is the root, nodes 1..num_columns are the column headers, the rest are matrix entries
+    def __init__(self, num_columns):
+        self.num_columns = num_columns
+        size = num_columns + 1
+        self.left = [i - 1 for i in range(size)]
+        self.right = [i + 1 for i in range(size)]
+        self.left[0] = num_columns
+        self.right[num_columns] = 0
+        self.up = list(range(size))
+        self.down = list(range(size))
+        self.column = list(range(size))
+        self.column_size = [0] * size
+        self.row_of_node = [-1] * size
+        self.num_rows = 0
+
+        #Search counters, read by find_solutions for SolverStats
+        self.nodes = 0
+        self.backtracks = 0
+        self.cancel_event = None #Set by search
+
+    def add_row(self, columns):
+        #columns are 0-based column numbers, returns the id of the new row
+        row_id = self.num_rows
+        self.num_rows += 1
+
+        first = None
+        for column in columns:
+            header = column + 1
+            node = len(self.column)
+
+            #Insert at the bottom of the column
+            self.column.append(header)
+            self.row_of_node.append(row_id)
+            self.up.append(self.up[header])
+            self.down.append(header)
+            self.down[self.up[header]] = node
+            self.up[header] = node
+            self.column_size[header] += 1
+
+            #Link into the row
+            if first is None:
+                first = node
+                self.left.append(node)
+                self.right.append(node)
+            else:
+                self.left.append(self.left[first])
+                self.right.append(first)
+                self.right[self.left[first]] = node
+                self.left[first] = node
+        return row_id
+
+    def cover(self, header):
+        left, right, up, down = self.left, self.right, self.up, self.down
+        column, column_size = self.column, self.column_size
+
+        right[left[header]] = right[header]
+        left[right[header]] = left[header]
+        i = down[header]
+        while i != header:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                column_size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, header):
+        left, right, up, down = self.left, self.right, self.up, self.down
+        column, column_size = self.column, self.column_size
+
+        i = up[header]
+        while i != header:
+            j = left[i]
+            while j != i:
+                column_size[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[header]] = header
+        left[right[header]] = header
+
+    def search(self, limit=1, cancel_event=None):
+        #Returns up to limit solutions, each a list of row ids.
+        #cancel_event is an optional threading.Event, the search stops with the solutions found so far once it is set
+        self.cancel_event = cancel_event
+        solutions = []
+        self._search([], solutions, limit)
+        return solutions
+
+    def _search(self, partial, solutions, limit):
+        right, down, column, column_size = self.right, self.down, self.column, self.column_size
+        self.nodes += 1
+
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            return True
+
+        if right[0] == 0:
+            solutions.append(list(partial))
+            return len(solutions) >= limit
+
+        #Choose the column with the fewest rows left
+        header = right[0]
+        best = header
+        while header != 0:
+            if column_size[header] < column_size[best]:
+                best = header
+                if column_size[best] <= 1:
+                    break
+            header = right[header]
+        if column_size[best] == 0:
+            return False
+
+        self.cover(best)
+        node = down[best]
+        while node != best:
+            partial.append(self.row_of_node[node])
+            j = right[node]
+            while j != node:
+                self.cover(column[j])
+                j = right[j]
+
+            done = self._search(partial, solutions, limit)
+
+            j = self.left[node]
+            while j != node:
+                self.uncover(column[j])
+                j = self.left[j]
+            partial.pop()
+            if done:
+                self.uncover(best)
+                return True
+            self.backtracks += 1
+            node = down[node]
+        self.uncover(best)
+        return False
+
+
+def is_supported(sudoku_board):
+    return all(isinstance(constraint, SUPPORTED_CONSTRAINTS) for constraint in sudoku_board.constraints)
+
+
+def build_exact_cover(sudoku_board):
+    #Columns: 81 cell, 81 row-digit, 81 column-digit and 81 box-digit columns, then for every killer cage
+    #one "combination chosen" column and one column per digit.
+    #Rows: one per (cell, candidate digit), plus one per possible digit combination of every cage.
+    #A cage digit column is covered either by the cage cell holding that digit or by the chosen combination
+    #when the digit is not part of it, so the cage ends up holding exactly one of its combinations.
+    for constraint in sudoku_board.constraints:
+        if not isinstance(constraint, SUPPORTED_CONSTRAINTS):
+            raise ValueError(f"Dancing links engine does not support {type(constraint).__name__}")
+
+    cages = [constraint for constraint in sudoku_board.constraints if isinstance(constraint, KillerCageConstraint)]
+    cage_column = {}
+    cages_of_cell = [[] for _ in range(81)]
+    for cage_number, cage in enumerate(cages):
+        cage_column[cage.constraint_id] = 324 + cage_number * 10
+        for index in cage.cell_indices:
+            cages_of_cell[index].append(cage)
+
+    dancing_links = DancingLinks(324 + len(cages) * 10)
+    row_meanings = []
+
+    candidates = sudoku_board.candidates
+    for index in range(81):
+        row, col, box = CELL_ROW[index], CELL_COL[index], CELL_BOX[index]
+        for digit in MASK_DIGITS[candidates[index]]:
+            columns = [
+                index,
+                81 + row * 9 + digit - 1,
+                162 + col * 9 + digit - 1,
+                243 + box * 9 + digit - 1,
+            ]
+            for cage in cages_of_cell[index]:
+                columns.append(cage_column[cage.constraint_id] + digit)
+            dancing_links.add_row(columns)
+            row_meanings.append((index, digit))
+
+    for cage in cages:
+        first_column = cage_column[cage.constraint_id]
+        for combo_mask in cage.possible_sum_masks:
+            columns = [first_column]
+            for digit in range(1, 10):
+                if not combo_mask & DIGIT_MASKS[digit]:
+                    columns.append(first_column + digit)
+            dancing_links.add_row(columns)
+            row_meanings.append(None)
+
+    return dancing_links, row_meanings
+
+
+def find_solutions(sudoku_board, limit=1, stats=None, cancel_event=None):
+    #Returns up to limit solutions of the board as flat lists of 81 values
+    dancing_links, row_meanings = build_exact_cover(sudoku_board)
+    solutions = []
+    found = dancing_links.search(limit, cancel_event)
+    if stats is not None:
+        stats.nodes += dancing_links.nodes
+        stats.backtracks += dancing_links.backtracks
+
+    for rows in found:
+        values = [0] * 81
+        for row_id in rows:
+            if row_meanings[row_id] is not None:
+                index, digit = row_meanings[row_id]
+                values[index] = digit
+        solutions.append(values)
+    return solutions
+
+
+def count_solutions(sudoku_board, limit=2, cancel_event=None):
+    #Number of solutions, counting stops at limit. A cancelled count is only a lower bound
+    dancing_links, _ = build_exact_cover(sudoku_board)
+    return len(dancing_links.search(limit, cancel_event))
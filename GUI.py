@@ -1,9 +1,9 @@
-import copy
 import sys
+import threading
 import weakref
 from collections import defaultdict
 
-from PyQt5.QtCore import QPointF, QRectF, Qt, QTimer
+from PyQt5.QtCore import QObject, QPointF, QRectF, Qt, QThread, QTimer, pyqtSignal
 from PyQt5.QtGui import (
     QBrush,
     QColor,
@@ -34,6 +34,10 @@ import predefined_sudoku_utils
 import solver
 from Constraints import *
 from enums import *
+from puzzle_store import PuzzleStoreError
+from solution_cache import SOLUTION_CACHE_FILE, SolutionCache
+from solver_budget import SolveBudget
+from solver_events import SolverEventSink, ThrottledEventSink
 from SudokuBoard import SudokuBoard
 
 class HoverableEllipse(QGraphicsEllipseItem):
@@ -55,16 +59,64 @@ class HoverableEllipse(QGraphicsEllipseItem):
         super().hoverLeaveEvent(event)
 
 
+class SignalEventSink(SolverEventSink):
+    """Forwards solver events as Qt signals of a SolverWorker"""
+    listening = True
+
+    def __init__(self, worker):
+        self.worker = worker
+
+    def state_changed(self, state):
+        self.worker.state_changed.emit(state)
+
+    def cells_changed(self, updates):
+        self.worker.cells_changed.emit(updates)
+
+
+class SolverWorker(QObject):
+    """Runs the solver on a background thread, the GUI only ever sees its signals"""
+    state_changed = pyqtSignal(object)
+    cells_changed = pyqtSignal(list)
+    finished = pyqtSignal(object)
+
+    #Batches are emitted more often than the GUI paints so the last frame is never stale,
+    #but rarely enough that the GUI event queue does not fill up with tiny updates
+    EMIT_INTERVAL = 1 / 60
+
+    #Seconds a solve may run before it is given up, so a puzzle without a reachable solution never hangs the GUI
+    SOLVE_TIME_LIMIT = 60
+
+    def __init__(self, sudoku_board, solution_cache=None):
+        super().__init__()
+        self.sudoku_board = sudoku_board
+        self.solution_cache = solution_cache
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        event_sink = ThrottledEventSink(SignalEventSink(self), interval=self.EMIT_INTERVAL)
+        result = solver.solve_with_budget(self.sudoku_board, time_limit=self.SOLVE_TIME_LIMIT, event_sink=event_sink,
+                                          cancel_event=self.cancel_event, cache=self.solution_cache)
+        self.finished.emit(result)
+
+    def cancel(self):
+        #Safe to call from the GUI thread, the search checks the event once per node
+        self.cancel_event.set()
+
+
 class SudokuGUI(QMainWindow):
+    #Seconds the uniqueness check on save may take before the answer is reported as unknown
+    UNIQUENESS_CHECK_TIME_LIMIT = 2
+
     def __init__(self):
         super().__init__()
 
         #Define which buttons are enabled during which states
         self.state_button_config = {
             GUIState.EMPTY_BOARD: [GUIButtons.SOLVE.value, GUIButtons.CLEAR.value, GUIButtons.LOAD_SUDOKU.value, GUIButtons.ADD_CONSTRAINTS.value],
-            GUIState.SOLVING: [],
+            GUIState.SOLVING: [GUIButtons.CANCEL_SOLVE.value],
             GUIState.SOLVED: [GUIButtons.CLEAR.value, GUIButtons.LOAD_SUDOKU.value, GUIButtons.ADD_CONSTRAINTS.value],
             GUIState.INCORRECT_SOLVE: [GUIButtons.CLEAR.value, GUIButtons.LOAD_SUDOKU.value],
+            GUIState.SOLVE_CANCELLED: [GUIButtons.SOLVE.value, GUIButtons.CLEAR.value, GUIButtons.LOAD_SUDOKU.value, GUIButtons.ADD_CONSTRAINTS.value],
             GUIState.EDITED: [GUIButtons.SOLVE.value, GUIButtons.CLEAR.value, GUIButtons.LOAD_SUDOKU.value, GUIButtons.SAVE.value, GUIButtons.ADD_CONSTRAINTS.value],
             GUIState.LOADING_SUDOKU: [GUIButtons.SOLVE.value, GUIButtons.CLEAR.value, GUIButtons.LEFT_ARROW.value, GUIButtons.RIGHT_ARROW.value, GUIButtons.ADD_CONSTRAINTS.value],
             GUIState.ADDING_CONSTRAINTS: [GUIButtons.WHITE_KROPKI_DOT.value, GUIButtons.BLACK_KROPKI_DOT.value, GUIButtons.KILLER_CAGE.value, GUIButtons.DONE_ADDING_CONSTRAINTS.value],
@@ -79,7 +131,12 @@ class SudokuGUI(QMainWindow):
 
         self.sudoku_board = SudokuBoard()
 
-        self.predefined_sudokus = predefined_sudoku_utils.create_predefined_sudokus()
+        self.predefined_store = predefined_sudoku_utils.open_predefined_store()
+        self.predefined_sudokus = predefined_sudoku_utils.PredefinedSudokus(self.predefined_store)
+
+        #Only one solve runs at a time, so the worker thread can use the cache without locking.
+        #Keyed by the puzzle as it is: finding the canonical form can take longer than solving a puzzle from scratch
+        self.solution_cache = SolutionCache(SOLUTION_CACHE_FILE)
         self.current_predefined_sudoku_index = 0
 
         self.constraint_selected_cells = []
@@ -88,6 +145,14 @@ class SudokuGUI(QMainWindow):
         self.constraint_drawings = {}
         self.delete_button_widget = None
 
+        #Background solve, solver cell updates are collected in pending_cell_updates and painted by repaint_timer
+        self.solver_thread = None
+        self.solver_worker = None
+        self.pending_cell_updates = {}
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.setInterval(1000 // 30)
+        self.repaint_timer.timeout.connect(self.paint_pending_cell_updates)
+
         self.setWindowTitle("Sudoku Solver")
         self.cell_size = 60
         self.grid_size = 9
@@ -179,6 +244,14 @@ class SudokuGUI(QMainWindow):
             #Show load sudoku button
             self.buttons[GUIButtons.LOAD_SUDOKU.value].show()
 
+        #Swap solve button for cancel button while solving
+        if new_state == GUIState.SOLVING:
+            self.buttons[GUIButtons.SOLVE.value].hide()
+            self.buttons[GUIButtons.CANCEL_SOLVE.value].show()
+        elif prev_state == GUIState.SOLVING:
+            self.buttons[GUIButtons.CANCEL_SOLVE.value].hide()
+            self.buttons[GUIButtons.SOLVE.value].show()
+
         #Hide/Show constraint buttons
         if new_state == GUIState.ADDING_CONSTRAINTS:
             #Hide buttons depending on previous state
@@ -308,7 +381,29 @@ class SudokuGUI(QMainWindow):
             new_value = int(new_value)
         self.sudoku_board.board[row][col].set_value(new_value)
 
-    def update_cell_value(self, row, col, new_value):
+    def queue_cell_updates(self, updates):
+        #Solver updates arrive through a queued signal, only the latest value of each cell is kept until the next frame
+        for row, col, new_value in updates:
+            self.pending_cell_updates[(row, col)] = new_value
+
+    def paint_pending_cell_updates(self):
+        if not self.pending_cell_updates:
+            return
+        updates = self.pending_cell_updates
+        self.pending_cell_updates = {}
+        for (row, col), new_value in updates.items():
+            self.update_cell_value(row, col, new_value, refresh=False)
+
+        #Already inside the event loop, so no processEvents here
+        self.scene.update()
+        self.view.viewport().update()
+
+    def set_cells_read_only(self, read_only):
+        for row in range(9):
+            for col in range(9):
+                self.cells[row][col].setReadOnly(read_only)
+
+    def update_cell_value(self, row, col, new_value, refresh=True):
         cell = self.cells[row][col]
         if new_value == 0:
             new_value = ''
@@ -322,7 +417,8 @@ class SudokuGUI(QMainWindow):
             }
             """
         )
-        self.refresh()
+        if refresh:
+            self.refresh()
 
     def enable_cell_selection(self):
         self.edit_mode = False
@@ -405,6 +501,35 @@ class SudokuGUI(QMainWindow):
         solve_btn.clicked.connect(self.solve_btn_clicked)
         self.button_row_1.addWidget(solve_btn)
         self.buttons[GUIButtons.SOLVE.value] = solve_btn
+
+        cancel_solve_btn = QPushButton("Cancel Solve")
+        cancel_solve_btn.setStyleSheet(
+            """
+            QPushButton{
+                background-color: #bb0000;
+                color: white;
+                padding: 10px 20px;
+                font-size: 20px;
+                border: none;
+                border-radius: 4px;
+                min-width: 100px;
+            }
+            QPushButton:hover {
+                font-weight:bold;
+                background-color: #990000;
+            }
+            QPushButton:pressed {
+                background-color: #770000;
+            }
+            QPushButton:disabled {
+                background-color: #4d4d4d;
+            }
+            """
+        )
+        cancel_solve_btn.clicked.connect(self.cancel_solve_btn_clicked)
+        self.button_row_1.addWidget(cancel_solve_btn)
+        self.buttons[GUIButtons.CANCEL_SOLVE.value] = cancel_solve_btn
+        cancel_solve_btn.hide()
         #endregion
 
         #region Clear Button
@@ -764,12 +889,68 @@ class SudokuGUI(QMainWindow):
 
     #region Button Click Methods
     def solve_btn_clicked(self):
-        solved_board = solver.solve(sudoku_board=self.sudoku_board, state_update_callback=self.set_state, cell_update_callback=self.update_cell_value)
+        if self.solver_thread is not None:
+            return
 
-        if solved_board:
+        #The worker gets its own copy so edits on the GUI thread can never race with the search,
+        #cells are locked anyway until the solve finishes
+        self.set_cells_read_only(True)
+        self.pending_cell_updates = {}
+
+        self.solver_thread = QThread()
+        self.solver_worker = SolverWorker(self.sudoku_board.clone(), self.solution_cache)
+        self.solver_worker.moveToThread(self.solver_thread)
+
+        self.solver_thread.started.connect(self.solver_worker.run)
+        self.solver_worker.state_changed.connect(self.set_state)
+        self.solver_worker.cells_changed.connect(self.queue_cell_updates)
+        self.solver_worker.finished.connect(self.solve_finished)
+        self.solver_worker.finished.connect(self.solver_thread.quit)
+        self.solver_thread.finished.connect(self.solver_thread_finished)
+        self.solver_thread.finished.connect(self.solver_worker.deleteLater)
+        self.solver_thread.finished.connect(self.solver_thread.deleteLater)
+
+        #Cell updates are painted at a fixed 30 fps instead of once per assignment
+        self.repaint_timer.start()
+        self.solver_thread.start()
+
+    def cancel_solve_btn_clicked(self):
+        if self.solver_worker is not None:
+            self.buttons[GUIButtons.CANCEL_SOLVE.value].setDisabled(True)
+            self.solver_worker.cancel()
+
+    def solve_finished(self, result):
+        self.repaint_timer.stop()
+        self.paint_pending_cell_updates()
+        self.set_cells_read_only(not self.edit_mode)
+
+        if result.status == SolveStatusEnum.SOLVED:
             self.show_toast_notification("Solved!")
-        else:
+        elif result.status == SolveStatusEnum.UNSATISFIABLE:
             self.show_toast_notification("Failed Solve :(")
+        else:
+            #Wipe the partial search from the grid, the board itself was never touched
+            for row in range(9):
+                for col in range(9):
+                    if self.sudoku_board.board[row][col].value == 0:
+                        self.cells[row][col].setText("")
+            if result.status == SolveStatusEnum.CANCELLED:
+                self.show_toast_notification("Solve Cancelled")
+            else:
+                self.show_toast_notification(f"Solve Gave Up After {SolverWorker.SOLVE_TIME_LIMIT} Seconds", duration=2500)
+
+    def solver_thread_finished(self):
+        #The references are only dropped once the thread has stopped, a QThread destroyed while running aborts
+        self.solver_worker = None
+        self.solver_thread = None
+
+    def closeEvent(self, event):
+        #Stop a running solve before the window goes away
+        if self.solver_thread is not None:
+            self.solver_worker.cancel()
+            self.solver_thread.quit()
+            self.solver_thread.wait()
+        super().closeEvent(event)
 
     def clear_btn_clicked(self):
         self.set_state(GUIState.EMPTY_BOARD)
@@ -795,12 +976,20 @@ class SudokuGUI(QMainWindow):
         self.refresh()
 
     def load_sudoku_btn_clicked(self):
-        predefined_sudoku = self.predefined_sudokus[self.current_predefined_sudoku_index]
+        if len(self.predefined_sudokus) == 0:
+            self.show_toast_notification("There are no saved sudokus.")
+            return
+
+        try:
+            predefined_sudoku = self.predefined_sudokus.get_board(self.current_predefined_sudoku_index)
+        except PuzzleStoreError as e:
+            self.show_toast_notification(f"There was an error when loading the sudoku.\n{e}", duration=4000)
+            return
         self.clear_btn_clicked()
         
         self.set_state(GUIState.LOADING_SUDOKU)
 
-        self.sudoku_board = copy.deepcopy(predefined_sudoku)
+        self.sudoku_board = predefined_sudoku.clone()
         for row in range(9):
             for col in range(9):
                 value = predefined_sudoku.board[row][col].value
@@ -858,11 +1047,30 @@ class SudokuGUI(QMainWindow):
                 case _:
                     continue
 
-        if predefined_sudoku_utils.save_predefined_sudoku(board_values, constraints):
-            self.show_toast_notification("Sudoku saved successfully!")
-            self.predefined_sudokus.append(self.sudoku_board)
+        try:
+            num_saved = len(self.predefined_store)
+            predefined_sudoku_utils.save_predefined_sudoku(board_values, constraints, store=self.predefined_store)
+        except PuzzleStoreError as e:
+            self.show_toast_notification(f"There was an error when saving the sudoku.\n{e}", duration=4000)
+            return
+
+        if len(self.predefined_store) == num_saved:
+            self.show_toast_notification("This sudoku is already saved.")
+            return
+
+        #Saving is still allowed for puzzles without a unique solution, but the user is told about it.
+        #The check runs on the GUI thread, so it is given up after a short time rather than freezing the window
+        budget = SolveBudget(time_limit=self.UNIQUENESS_CHECK_TIME_LIMIT)
+        num_solutions = solver.count_solutions(self.sudoku_board, limit=2, budget=budget)
+        if num_solutions < 2 and budget.exhausted is not None:
+            uniqueness = "Could not check whether it has a unique solution."
+        elif num_solutions == 1:
+            uniqueness = "It has a unique solution."
+        elif num_solutions == 0:
+            uniqueness = "Warning: it has no solution."
         else:
-            self.show_toast_notification("There was an error when saving the sudoku.")
+            uniqueness = "Warning: it has more than one solution."
+        self.show_toast_notification(f"Sudoku saved successfully!\n{uniqueness}", duration=2500)
 
     def white_kropki_dot_btn_clicked(self):
         self.enable_cell_selection()
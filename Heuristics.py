@@ -0,0 +1,120 @@
+from abc import ABC, abstractmethod
+
+from bitmask_utils import POPCOUNT
+from Constraints import BoxConstraint, ColumnConstraint, RowConstraint
+from SudokuBoard import PEERS
+
+#Cell selection heuristics for the backtracking search. A heuristic is attached to the board while a solve runs
+#(see solver.solve), without one the board falls back to its bucketed minimum remaining values selection.
+
+
+class CellHeuristic(ABC):
+
+    name = 'heuristic'
+
+    @abstractmethod
+    def select_cell(self, board):
+        #Returns the empty SudokuCell to branch on next, or None if the board is full
+        pass
+
+    def constraint_failed(self, constraint):
+        #Called whenever propagating the constraint wiped out a cell, heuristics that learn from conflicts override this
+        pass
+
+
+class MinimumRemainingValues(CellHeuristic):
+    #Fewest candidates first, ties broken by the cell with the most constraints
+    name = 'mrv'
+
+    def select_cell(self, board):
+        return board.find_least_num_possible_cell()
+
+
+def _empty_neighbours(board, constraint, index):
+    values = board.values
+    return sum(1 for other in constraint.cell_indices if other != index and values[other] == 0)
+
+
+UNIT_CONSTRAINTS = (RowConstraint, ColumnConstraint, BoxConstraint)
+
+
+class MaxDegree(CellHeuristic):
+    #Most empty cells sharing a constraint with the cell first, ties broken by fewest candidates.
+    #Row, column and box neighbours are counted once each through the shared peer index.
+    #Counting neighbours is far more work than MRV, it is meant for comparing search trees rather than speed
+    name = 'degree'
+
+    def select_cell(self, board):
+        buckets = board.candidate_buckets
+        if buckets[0]:
+            return board.cells[next(iter(buckets[0]))]
+
+        values = board.values
+        best_index = -1
+        best_score = None
+        for count in range(1, 10):
+            for index in buckets[count]:
+                degree = sum(1 for peer in PEERS[index] if values[peer] == 0)
+                for constraint in board.cells[index].constraints:
+                    if not isinstance(constraint, UNIT_CONSTRAINTS):
+                        degree += _empty_neighbours(board, constraint, index)
+                score = (-degree, count)
+                if best_score is None or score < best_score:
+                    best_index = index
+                    best_score = score
+
+        if best_index == -1:
+            return None
+        return board.cells[best_index]
+
+
+class DomWdeg(CellHeuristic):
+    #Fewest candidates per weighted degree first (Boussemart et al. 2004). Every constraint starts with weight 1 and
+    #gains 1 each time it causes a wipeout, so the search is drawn towards the parts of the puzzle that keep failing.
+    #A fresh instance is needed per solve, the weights are learnt during the search
+    name = 'dom_wdeg'
+
+    def __init__(self):
+        self.weights = {}
+
+    def constraint_failed(self, constraint):
+        self.weights[constraint.constraint_id] = self.weights.get(constraint.constraint_id, 1) + 1
+
+    def select_cell(self, board):
+        buckets = board.candidate_buckets
+        if buckets[0]:
+            return board.cells[next(iter(buckets[0]))]
+
+        weights = self.weights
+        candidates = board.candidates
+        best_index = -1
+        best_score = None
+        for count in range(1, 10):
+            for index in buckets[count]:
+                #Only constraints that still have another empty cell can fail because of this cell
+                weighted_degree = 0
+                for constraint in board.cells[index].constraints:
+                    if _empty_neighbours(board, constraint, index):
+                        weighted_degree += weights.get(constraint.constraint_id, 1)
+                score = POPCOUNT[candidates[index]] / max(weighted_degree, 1)
+                if best_score is None or score < best_score:
+                    best_index = index
+                    best_score = score
+
+        if best_index == -1:
+            return None
+        return board.cells[best_index]
+
+
+HEURISTICS = {
+    MinimumRemainingValues.name: MinimumRemainingValues,
+    MaxDegree.name: MaxDegree,
+    DomWdeg.name: DomWdeg,
+}
+
+
+def create_heuristic(name):
+    #New instance of the heuristic registered under name
+    if name not in HEURISTICS:
+        raise KeyError(f"Unknown heuristic: {name}")
+    return HEURISTICS[name]()
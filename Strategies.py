@@ -0,0 +1,291 @@
+import time
+from abc import ABC, abstractmethod
+from itertools import combinations
+
+from bitmask_utils import ALL_DIGITS, DIGIT_MASKS, MASK_DIGITS, POPCOUNT
+from SudokuBoard import BOX_UNITS, CELL_BOX, CELL_COL, CELL_ROW, COL_UNITS, ROW_UNITS, UNITS
+
+#Logical deductions run between branching steps of the solver.
+#Every strategy only relies on the row/column/box rules, so it stays valid whatever variant constraints the board has.
+
+class Strategy(ABC):
+
+    name = 'strategy'
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+
+        #Stats collected by the StrategyPipeline
+        self.calls = 0
+        self.time_spent = 0.0
+        self.eliminations = 0
+
+    @abstractmethod
+    def find_eliminations(self, board):
+        #Returns a list of (cell index, digit mask) candidates that can be removed,
+        #or None if the board is found to be contradictory
+        pass
+
+
+def _unit_digit_positions(board, unit):
+    #Map each unplaced digit of the unit to the empty cells that can still hold it
+    #Returns None if some unplaced digit has nowhere to go
+    values = board.values
+    candidates = board.candidates
+
+    placed = 0
+    positions = {}
+    for index in unit:
+        if values[index] != 0:
+            placed |= DIGIT_MASKS[values[index]]
+            continue
+        for digit in MASK_DIGITS[candidates[index]]:
+            positions.setdefault(digit, []).append(index)
+
+    for digit in MASK_DIGITS[ALL_DIGITS & ~placed]:
+        if digit not in positions:
+            return None
+    return positions
+
+
+class HiddenSingles(Strategy):
+    #A digit that fits in only one cell of a unit must go there
+    name = 'hidden_singles'
+
+    def find_eliminations(self, board):
+        values = board.values
+        candidates = board.candidates
+        eliminations = []
+        for unit in UNITS:
+            placed = 0
+            once = 0
+            twice = 0
+            for index in unit:
+                if values[index] != 0:
+                    placed |= DIGIT_MASKS[values[index]]
+                else:
+                    twice |= once & candidates[index]
+                    once |= candidates[index]
+
+            if ALL_DIGITS & ~(placed | once):
+                return None
+
+            singles = once & ~twice & ~placed
+            if singles == 0:
+                continue
+            for index in unit:
+                if values[index] == 0 and candidates[index] & singles:
+                    if POPCOUNT[candidates[index] & singles] > 1:
+                        #Two digits can only go in this one cell
+                        return None
+                    if candidates[index] != candidates[index] & singles:
+                        eliminations.append((index, candidates[index] & ~singles))
+        return eliminations
+
+
+class NakedSubset(Strategy):
+    #N cells of a unit that together hold only N digits claim those digits for the unit
+    def __init__(self, size, enabled=True):
+        super().__init__(enabled)
+        self.size = size
+        self.name = {2: 'naked_pairs', 3: 'naked_triples'}.get(size, f'naked_subsets_{size}')
+
+    def find_eliminations(self, board):
+        values = board.values
+        candidates = board.candidates
+        size = self.size
+        eliminations = []
+        for unit in UNITS:
+            empty_cells = [index for index in unit if values[index] == 0]
+            if len(empty_cells) <= size:
+                continue
+            small_cells = [index for index in empty_cells if 2 <= POPCOUNT[candidates[index]] <= size]
+            for subset in combinations(small_cells, size):
+                union = 0
+                for index in subset:
+                    union |= candidates[index]
+                if POPCOUNT[union] != size:
+                    continue
+                for index in empty_cells:
+                    if index not in subset and candidates[index] & union:
+                        eliminations.append((index, union))
+        return eliminations
+
+
+class HiddenSubset(Strategy):
+    #N digits that only fit in the same N cells of a unit remove every other digit from those cells
+    def __init__(self, size, enabled=True):
+        super().__init__(enabled)
+        self.size = size
+        self.name = {2: 'hidden_pairs', 3: 'hidden_triples'}.get(size, f'hidden_subsets_{size}')
+
+    def find_eliminations(self, board):
+        candidates = board.candidates
+        size = self.size
+        eliminations = []
+        for unit in UNITS:
+            positions = _unit_digit_positions(board, unit)
+            if positions is None:
+                return None
+            if len(positions) <= size:
+                continue
+
+            digits = [digit for digit, cells in positions.items() if 2 <= len(cells) <= size]
+            for subset in combinations(digits, size):
+                cells = set()
+                digit_mask = 0
+                for digit in subset:
+                    cells.update(positions[digit])
+                    digit_mask |= DIGIT_MASKS[digit]
+                if len(cells) < size:
+                    return None
+                if len(cells) != size:
+                    continue
+                for index in cells:
+                    if candidates[index] & ~digit_mask:
+                        eliminations.append((index, candidates[index] & ~digit_mask))
+        return eliminations
+
+
+class PointingPairs(Strategy):
+    #If a digit's places in a box all share a row or column, it can be removed from the rest of that line
+    name = 'pointing_pairs'
+
+    def find_eliminations(self, board):
+        eliminations = []
+        for box in BOX_UNITS:
+            positions = _unit_digit_positions(board, box)
+            if positions is None:
+                return None
+            for digit, cells in positions.items():
+                if len(cells) == 1:
+                    continue
+                rows = set(CELL_ROW[index] for index in cells)
+                cols = set(CELL_COL[index] for index in cells)
+                if len(rows) == 1:
+                    line = ROW_UNITS[rows.pop()]
+                elif len(cols) == 1:
+                    line = COL_UNITS[cols.pop()]
+                else:
+                    continue
+                _eliminate_outside(board, line, cells, DIGIT_MASKS[digit], eliminations)
+        return eliminations
+
+
+class BoxLineReduction(Strategy):
+    #If a digit's places in a row or column all sit in one box, it can be removed from the rest of that box
+    name = 'box_line_reduction'
+
+    def find_eliminations(self, board):
+        eliminations = []
+        for line in ROW_UNITS + COL_UNITS:
+            positions = _unit_digit_positions(board, line)
+            if positions is None:
+                return None
+            for digit, cells in positions.items():
+                if len(cells) == 1:
+                    continue
+                boxes = set(CELL_BOX[index] for index in cells)
+                if len(boxes) == 1:
+                    _eliminate_outside(board, BOX_UNITS[boxes.pop()], cells, DIGIT_MASKS[digit], eliminations)
+        return eliminations
+
+
+class XWing(Strategy):
+    #If a digit fits in exactly the same two columns of two rows, it can be removed from the rest of those columns
+    #(and the same with rows and columns swapped)
+    name = 'x_wing'
+
+    def find_eliminations(self, board):
+        eliminations = []
+        for lines, crossing_lines, crossing_of in ((ROW_UNITS, COL_UNITS, CELL_COL), (COL_UNITS, ROW_UNITS, CELL_ROW)):
+            for digit in range(1, 10):
+                digit_mask = DIGIT_MASKS[digit]
+                pairs = {}
+                for line in lines:
+                    cells = [index for index in line if board.values[index] == 0 and board.candidates[index] & digit_mask]
+                    if len(cells) == 2:
+                        key = (crossing_of[cells[0]], crossing_of[cells[1]])
+                        pairs.setdefault(key, []).extend(cells)
+
+                for (crossing1, crossing2), cells in pairs.items():
+                    if len(cells) != 4:
+                        continue
+                    _eliminate_outside(board, crossing_lines[crossing1], cells, digit_mask, eliminations)
+                    _eliminate_outside(board, crossing_lines[crossing2], cells, digit_mask, eliminations)
+        return eliminations
+
+
+def _eliminate_outside(board, unit, keep_cells, digit_mask, eliminations):
+    for index in unit:
+        if index not in keep_cells and board.values[index] == 0 and board.candidates[index] & digit_mask:
+            eliminations.append((index, digit_mask))
+
+
+class StrategyPipeline():
+    #Runs the enabled strategies, cheapest first, until none of them can make progress
+    def __init__(self, strategies):
+        self.strategies = strategies
+
+    def get_strategy(self, name):
+        for strategy in self.strategies:
+            if strategy.name == name:
+                return strategy
+        raise KeyError(f"Unknown strategy: {name}")
+
+    def set_enabled(self, name, enabled):
+        self.get_strategy(name).enabled = enabled
+
+    def run(self, board):
+        #Returns False if a strategy or the propagation it triggers finds a contradiction
+        progress = True
+        while progress:
+            progress = False
+            for strategy in self.strategies:
+                if not strategy.enabled:
+                    continue
+
+                start = time.perf_counter()
+                eliminations = strategy.find_eliminations(board)
+                strategy.time_spent += time.perf_counter() - start
+                strategy.calls += 1
+
+                if eliminations is None:
+                    return False
+                if not eliminations:
+                    continue
+
+                strategy.eliminations += len(eliminations)
+                if not board.eliminate(eliminations):
+                    return False
+
+                #Start again from the cheapest strategy
+                progress = True
+                break
+        return True
+
+    def report(self):
+        return {
+            strategy.name: {
+                'enabled': strategy.enabled,
+                'calls': strategy.calls,
+                'time_spent': strategy.time_spent,
+                'eliminations': strategy.eliminations,
+            }
+            for strategy in self.strategies
+        }
+
+
+def create_default_pipeline():
+    #Only hidden singles pay for themselves at every node on the predefined sudokus,
+    #the other strategies are there to be switched on for harder puzzles
+    return StrategyPipeline([
+        HiddenSingles(),
+        NakedSubset(2, enabled=False),
+        HiddenSubset(2, enabled=False),
+        PointingPairs(enabled=False),
+        BoxLineReduction(enabled=False),
+        NakedSubset(3, enabled=False),
+        HiddenSubset(3, enabled=False),
+        XWing(enabled=False),
+    ])
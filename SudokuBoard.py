@@ -1,77 +1,373 @@
 import copy
+from collections import deque
 
+from bitmask_utils import ALL_DIGITS, DIGIT_MASKS, LOWEST_DIGIT, POPCOUNT
 from Constraints import *
 from SudokuCell import SudokuCell
 
+#Board topology, computed once and shared by every board. Everything is a tuple so it cannot be changed by accident
+
+#Row, column and box of every flat cell index
+CELL_ROW = tuple(index // 9 for index in range(81))
+CELL_COL = tuple(index % 9 for index in range(81))
+CELL_BOX = tuple((index // 27) * 3 + (index % 9) // 3 for index in range(81))
+
+#Flat cell indices of every row, column and box
+ROW_UNITS = tuple(tuple(row * 9 + col for col in range(9)) for row in range(9))
+COL_UNITS = tuple(tuple(row * 9 + col for row in range(9)) for col in range(9))
+BOX_UNITS = tuple(tuple(index for index in range(81) if CELL_BOX[index] == box) for box in range(9))
+UNITS = ROW_UNITS + COL_UNITS + BOX_UNITS
+
+#The 20 other cells sharing a row, column or box with each cell
+PEERS = tuple(
+    tuple(sorted(set(ROW_UNITS[CELL_ROW[index]] + COL_UNITS[CELL_COL[index]] + BOX_UNITS[CELL_BOX[index]]) - {index}))
+    for index in range(81)
+)
+
+#Position in SudokuBoard.constraints of the row, column and box constraint of every cell, in the order the cell
+#lists them. Every board starts with the same 27 constraints: row 0, column 0, row 1, column 1, ..., then the boxes
+UNIT_CONSTRAINT_SLOTS = tuple(
+    tuple(sorted((2 * CELL_ROW[index], 2 * CELL_COL[index] + 1, 18 + CELL_BOX[index])))
+    for index in range(81)
+)
+
 
 class SudokuBoard():
     def __init__(self):
         self.constraints = []  # List of all constraints on the board
+
+        #Flat 81 entry arrays holding the mutable state of the board, indexed by row * 9 + col
+        self.values = [0] * 81
+        self.candidates = [ALL_DIGITS] * 81
+
+        #Kept up to date as values change so is_solved never has to rescan the board:
+        #the number of empty cells, and the cells changed since their constraints were last verified
+        self.empty_count = 81
+        self.dirty_cells = set()
+
+        #Empty cells bucketed by their number of candidates, so the most constrained cell is found
+        #without scanning the board. Updated by every candidate change, placement and undo
+        self.candidate_buckets = [set() for _ in range(10)]
+        self.candidate_buckets[9].update(range(81))
+
+        #Undo log of (index, old value, old candidates) entries, None until a search starts recording
+        self.trail = None
+
+        #Scheduler state, only set while propagate() is running
+        self.propagation_queue = None
+        self.queued_constraints = None
+        self.forced_singles = None
+
+        #SolverStats of the running solve, None when nobody is collecting
+        self.stats = None
+
+        #CellHeuristic of the running solve, None selects cells with find_least_num_possible_cell
+        self.heuristic = None
+
+        self.cells = []  # Flat list of SudokuCell objects
         self.board = self.create_empty_board()  # 2D list of SudokuCell objects
 
     def is_board_empty(self):
         if len(self.constraints) > 27: #27 is the number of row, column, and box constraints
             return False
-        
-        for row in self.board:
-            for cell in row:
-                if cell.value != 0:
-                    return False
-        return True
+
+        return self.empty_count == 81
 
     def find_least_num_possible_cell(self):
-        empty_cells = [cell for row in self.board for cell in row if cell.value == 0]
+        #Minimum remaining values, ties broken by the cell with the most constraints
+        #A cell without candidates is returned straight away so the search backtracks
+        cells = self.cells
+        for bucket in self.candidate_buckets:
+            if bucket:
+                return cells[max(bucket, key=lambda index: len(cells[index].constraints))]
+        return None
 
-        #Sort empty cells by number of constrains
-        empty_cells.sort(key=lambda cell: (len(cell.possible_values), -len(cell.constraints)))
+    def select_cell(self):
+        #Next cell to branch on, None if the board is full
+        if self.heuristic is None:
+            return self.find_least_num_possible_cell()
+        return self.heuristic.select_cell(self)
 
-        return empty_cells[0]
 
-    
     def is_solved(self):
         #Check that each cell is filled
-        for row in self.board:
-            for cell in row:
-                if cell.value == 0:
+        if self.empty_count:
+            return False
+
+        #Now check that the constraints of the changed cells are satisfied, everything else was verified before
+        if not self.dirty_cells:
+            return True
+
+        stats = self.stats
+        cells = self.cells
+        constraints = {}
+        for index in self.dirty_cells:
+            for constraint in cells[index].constraints:
+                constraints[constraint.constraint_id] = constraint
+
+        #Cells of a violated constraint stay dirty so it is checked again next time
+        violated_cells = set()
+        for constraint in constraints.values():
+            if not (constraint.verify_constraint() if stats is None else stats.measure_verify(constraint)):
+                violated_cells.update(constraint.cell_indices)
+        self.dirty_cells = violated_cells
+
+        return not violated_cells
+
+    def set_candidates(self, index, mask):
+        if self.trail is not None:
+            self.trail.append((index, self.values[index], self.candidates[index]))
+        if self.stats is not None:
+            self.stats.candidates_removed += POPCOUNT[self.candidates[index]] - POPCOUNT[mask]
+        if self.values[index] == 0:
+            old_count = POPCOUNT[self.candidates[index]]
+            if old_count != POPCOUNT[mask]:
+                self.candidate_buckets[old_count].discard(index)
+                self.candidate_buckets[POPCOUNT[mask]].add(index)
+        self.candidates[index] = mask
+
+        #While propagating, wake the constraints watching this cell's candidates
+        if self.propagation_queue is not None:
+            for constraint in self.cells[index].constraints:
+                if constraint.watches_candidates and constraint.constraint_id not in self.queued_constraints:
+                    self.queued_constraints.add(constraint.constraint_id)
+                    self.propagation_queue.append(constraint)
+            if POPCOUNT[mask] == 1 and self.values[index] == 0:
+                self.forced_singles.append(index)
+
+    def place_value(self, index, value):
+        #Write a digit into an empty cell without propagating it
+        if self.trail is not None:
+            self.trail.append((index, 0, self.candidates[index]))
+        self.values[index] = value
+        self.empty_count -= 1
+        self.dirty_cells.add(index)
+        self.candidate_buckets[POPCOUNT[self.candidates[index]]].discard(index)
+
+        digit_mask = DIGIT_MASKS[value]
+        self.candidates[index] = digit_mask
+
+    def set_cell_value(self, index, value):
+        #Returns False if the new value breaks a constraint or leaves a cell without candidates
+        old_value = self.values[index]
+        if old_value == value:
+            return True
+
+        if old_value != 0:
+            #Eliminations made because of the old value are no longer valid
+            #Only done while editing, the trail never records clearing a value
+            self.values[index] = value
+            if value == 0:
+                self.empty_count += 1
+            else:
+                self.dirty_cells.add(index)
+            return self.refresh_candidates()
+
+        self.place_value(index, value)
+        return self.propagate(self.cells[index].constraints)
+
+    def assign(self, index, value):
+        #Place a digit during search and propagate to fixpoint, filling in any forced singles
+        #Returns False if the board reached a contradiction
+        self.place_value(index, value)
+        return self.propagate(self.cells[index].constraints, assign_singles=True)
+
+    def eliminate(self, eliminations):
+        #Remove (index, digit mask) candidates found by a solving strategy and propagate the result
+        return self.propagate([], assign_singles=True, eliminations=eliminations)
+
+    def propagate(self, constraints, assign_singles=False, eliminations=()):
+        #Work-queue propagation: constraints are re-run whenever a cell they watch changes,
+        #until nothing changes anymore. Returns False if a contradiction was found
+        stats = self.stats
+        if stats is not None:
+            stats.propagations += 1
+
+        queue = deque(constraints)
+        self.propagation_queue = queue
+        self.queued_constraints = set(constraint.constraint_id for constraint in constraints)
+        self.forced_singles = []
+
+        values = self.values
+        candidates = self.candidates
+        try:
+            for index, digit_mask in eliminations:
+                if values[index] != 0 or not candidates[index] & digit_mask:
+                    continue
+                remaining = candidates[index] & ~digit_mask
+                if remaining == 0:
                     return False
+                self.set_candidates(index, remaining)
+
+            while True:
+                while queue:
+                    constraint = queue.popleft()
+                    #An idempotent constraint stays marked as queued while it runs so its own changes do not re-queue it
+                    if not constraint.idempotent:
+                        self.queued_constraints.discard(constraint.constraint_id)
+                    consistent = constraint.propagate() if stats is None else stats.measure_propagate(constraint)
+                    if constraint.idempotent:
+                        self.queued_constraints.discard(constraint.constraint_id)
+                    if consistent is False:
+                        if self.heuristic is not None:
+                            self.heuristic.constraint_failed(constraint)
+                        return False
+
+                if not assign_singles or not self.forced_singles:
+                    return True
+
+                #Naked singles left by propagation are placed one at a time, which wakes every constraint on the cell
+                index = self.forced_singles.pop()
+                if values[index] != 0:
+                    continue
+                if candidates[index] == 0:
+                    return False
+                self.place_value(index, LOWEST_DIGIT[candidates[index]])
+                for constraint in self.cells[index].constraints:
+                    if constraint.constraint_id not in self.queued_constraints:
+                        self.queued_constraints.add(constraint.constraint_id)
+                        queue.append(constraint)
+        finally:
+            self.propagation_queue = None
+            self.queued_constraints = None
+            self.forced_singles = None
+
+    def placed_since(self, mark):
+        #Indices of the cells filled in since mark, in the order they were filled
+        placed = []
+        seen = set()
+        values = self.values
+        for index, old_value, _ in self.trail[mark:]:
+            if old_value == 0 and values[index] != 0 and index not in seen:
+                seen.add(index)
+                placed.append(index)
+        return placed
+
+    def mark(self):
+        #Start recording changes if needed and return the position to undo back to
+        if self.trail is None:
+            self.trail = []
+        return len(self.trail)
+
+    def undo(self, mark):
+        #Roll back every assignment and candidate removal recorded since mark
+        trail = self.trail
+        values = self.values
+        candidates = self.candidates
+        buckets = self.candidate_buckets
+        while len(trail) > mark:
+            index, old_value, old_candidates = trail.pop()
+            value = values[index]
+            if value != old_value:
+                #The search only fills empty cells, so the cell goes back to being empty
+                values[index] = old_value
+                self.empty_count += 1
+                buckets[POPCOUNT[old_candidates]].add(index)
+            elif value == 0:
+                buckets[POPCOUNT[candidates[index]]].discard(index)
+                buckets[POPCOUNT[old_candidates]].add(index)
+            candidates[index] = old_candidates
 
-        #Now check that all constraints are satisfied
-        for constraint in self.constraints:
-            if not constraint.verify_constraint():
-                return False
+    def snapshot(self):
+        #Copy of the mutable state, values and candidates plus what is derived from them, for restore().
+        #Constraints are not part of it, ones added after the snapshot stay on the board
+        return (
+            self.values[:], self.candidates[:], self.empty_count, set(self.dirty_cells), [set(bucket) for bucket in self.candidate_buckets],
+        )
 
-        return True    
+    def restore(self, snapshot):
+        #Put the board back in the state of a snapshot() of it, in place
+        values, candidates, empty_count, dirty_cells, buckets = snapshot
+        self.values[:] = values
+        self.candidates[:] = candidates
+        self.empty_count = empty_count
+        self.dirty_cells = set(dirty_cells)
+        for bucket, saved_bucket in zip(self.candidate_buckets, buckets):
+            bucket.clear()
+            bucket.update(saved_bucket)
+        self.trail = None
+
+    def clone(self):
+        #Independent board in the same state, much cheaper than copy.deepcopy: only the mutable arrays are copied,
+        #constraints are shallow copies rebound to the new cells so their indices and lookup tables are shared.
+        #The trail, stats and heuristic are not carried over
+        board = SudokuBoard.__new__(SudokuBoard)
+        board.values = self.values[:]
+        board.candidates = self.candidates[:]
+        board.empty_count = self.empty_count
+        board.dirty_cells = set(self.dirty_cells)
+        board.candidate_buckets = [set(bucket) for bucket in self.candidate_buckets]
+        board.trail = None
+        board.propagation_queue = None
+        board.queued_constraints = None
+        board.forced_singles = None
+        board.stats = None
+        board.heuristic = None
+
+        cells = [SudokuCell(index // 9, index % 9, board) for index in range(81)]
+        board.cells = cells
+        board.board = [cells[row * 9:(row + 1) * 9] for row in range(9)]
+
+        rebound = {}
+        def rebind(constraint):
+            constraint_copy = rebound.get(constraint.constraint_id)
+            if constraint_copy is None:
+                constraint_copy = copy.copy(constraint)
+                constraint_copy.board = board
+                constraint_copy.affected_cells = [cells[index] for index in constraint.cell_indices]
+                rebound[constraint.constraint_id] = constraint_copy
+            return constraint_copy
+
+        board.constraints = [rebind(constraint) for constraint in self.constraints]
+        for cell, original in zip(cells, self.cells):
+            cell.constraints = [rebind(constraint) for constraint in original.constraints]
+        return board
+
+    def mark_dirty(self, indices):
+        #Verify the constraints of these cells again on the next is_solved, e.g. after adding a constraint
+        self.dirty_cells.update(indices)
+
+    def refresh_candidates(self):
+        #Rebuild the candidates from the placed values
+        #Returns False if the placed values break a constraint or leave a cell without candidates
+        row_used = [0] * 9
+        col_used = [0] * 9
+        box_used = [0] * 9
+        for index, value in enumerate(self.values):
+            digit_mask = DIGIT_MASKS[value]
+            row_used[CELL_ROW[index]] |= digit_mask
+            col_used[CELL_COL[index]] |= digit_mask
+            box_used[CELL_BOX[index]] |= digit_mask
+
+        for index, value in enumerate(self.values):
+            if value != 0:
+                self.candidates[index] = DIGIT_MASKS[value]
+            else:
+                used = row_used[CELL_ROW[index]] | col_used[CELL_COL[index]] | box_used[CELL_BOX[index]]
+                self.candidates[index] = ALL_DIGITS & ~used
+
+        for bucket in self.candidate_buckets:
+            bucket.clear()
+        for index, value in enumerate(self.values):
+            if value == 0:
+                self.candidate_buckets[POPCOUNT[self.candidates[index]]].add(index)
+
+        return self.propagate(self.constraints)
 
     def create_empty_board(self):
         #Create empty board
-        board = [[SudokuCell(row, col) for col in range(9)] for row in range(9)]
+        cells = [SudokuCell(index // 9, index % 9, self) for index in range(81)]
+        self.cells = cells
 
         #Now add constraints
         for i in range(9):
-            #Row constraints
-            row_cells = [board[i][col] for col in range(9)]
-            row_constraint = RowConstraint(row_cells)
-            self.constraints.append(row_constraint)
-            for cell in row_cells:
-                cell.constraints.append(row_constraint)
-
-            #Column constraints
-            col_cells = [board[row][i] for row in range(9)]
-            col_constraint = ColumnConstraint(col_cells)
-            self.constraints.append(col_constraint)
-            for cell in col_cells:
-                cell.constraints.append(col_constraint)
-        
-        #Box constraints
-        for box_row in range(3):
-            for box_col in range(3):
-                box_cells = []
-                for i in range(3):
-                    for j in range(3):
-                        box_cells.append(board[box_row*3 + i][box_col*3 + j])
-                box_constraint = BoxConstraint(box_cells)
-                self.constraints.append(box_constraint)
-                for cell in box_cells:
-                    cell.constraints.append(box_constraint)
-        
-        return board
+            self.constraints.append(RowConstraint([cells[index] for index in ROW_UNITS[i]]))
+            self.constraints.append(ColumnConstraint([cells[index] for index in COL_UNITS[i]]))
+        for box in range(9):
+            self.constraints.append(BoxConstraint([cells[index] for index in BOX_UNITS[box]]))
+
+        constraints = self.constraints
+        for index, cell in enumerate(cells):
+            cell.constraints = [constraints[slot] for slot in UNIT_CONSTRAINT_SLOTS[index]]
+
+        return [cells[row * 9:(row + 1) * 9] for row in range(9)]
@@ -1,17 +1,46 @@
+from bitmask_utils import digits_to_mask, mask_to_digits
+
+
 class SudokuCell:
-    def __init__(self, row, col):
+    #A cell is a view into the flat value/candidate arrays of the SudokuBoard that owns it.
+    #Slots keep the 81 cells of every board small, a cell has no state beyond these references
+    __slots__ = ('row', 'col', 'id', 'index', 'board', 'constraints')
+
+    def __init__(self, row, col, board):
         self.row = row
         self.col = col
         self.id = (row * 10) + col
-        self.value = 0 # 0 indicates an empty cell
-        self.possible_values = set(range(1, 10)) # Possible values from 1 to 9
+        self.index = (row * 9) + col # Position in the board's flat arrays
+        self.board = board
         self.constraints = [] # List of constraint objects affecting this cell
 
+    @property
+    def value(self):
+        # 0 indicates an empty cell
+        return self.board.values[self.index]
+
+    @property
+    def candidates(self):
+        #Bitmask of the digits still possible in this cell
+        return self.board.candidates[self.index]
+
+    @candidates.setter
+    def candidates(self, mask):
+        self.board.set_candidates(self.index, mask)
+
+    @property
+    def possible_values(self):
+        #Set view of the candidate mask, kept for code that works with sets of digits
+        return mask_to_digits(self.board.candidates[self.index])
+
+    @possible_values.setter
+    def possible_values(self, values):
+        self.board.set_candidates(self.index, digits_to_mask(values))
+
     def set_value(self, value):
-        self.value = value
-        for constraint in self.constraints:
-            constraint.propagate()
+        self.board.set_cell_value(self.index, value)
 
     def add_constraint(self, constraint):
         self.constraints.append(constraint)
-        constraint.propagate()
\ No newline at end of file
+        self.board.mark_dirty(constraint.cell_indices)
+        self.board.propagate([constraint])
@@ -0,0 +1,104 @@
+import predefined_sudoku_utils
+import solver
+from bitmask_utils import ALL_DIGITS, DIGIT_MASKS, LOWEST_DIGIT, POPCOUNT
+from enums import SolverEngineEnum
+from SudokuBoard import CELL_BOX, CELL_COL, CELL_ROW, UNITS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Batch engine for classic puzzles. N puzzles are held as (N, 81) arrays of values and candidate masks, and
+#row/column/box elimination, naked singles and hidden singles run as array operations over the whole batch.
+#Most classic puzzles are solved by singles alone; the ones that stall are finished one at a time by solver.solve.
+#NumPy is optional, without it every puzzle goes through solver.solve.
+
+if np is not None:
+    UNIT_CELLS = np.array(UNITS, dtype=np.intp) #(27, 9) cells of every row, column and box
+    CELL_UNITS = np.array([(CELL_ROW[index], 9 + CELL_COL[index], 18 + CELL_BOX[index]) for index in range(81)],
+                          dtype=np.intp) #(81, 3) units of every cell
+    DIGIT_MASK_TABLE = np.array(DIGIT_MASKS, dtype=np.uint16)
+    POPCOUNT_TABLE = np.array(POPCOUNT, dtype=np.uint8)
+    LOWEST_DIGIT_TABLE = np.array(LOWEST_DIGIT, dtype=np.uint8)
+
+
+def propagate_batch(values, candidates):
+    #Apply singles to a fixpoint on (N, 81) value and candidate arrays, in place.
+    #Returns an (N,) bool array marking the puzzles that reached a contradiction
+    failed = np.zeros(values.shape[0], dtype=bool)
+    active = np.arange(values.shape[0])
+    while active.size:
+        batch_values = values[active]
+        batch_candidates = candidates[active]
+        batch_failed = np.zeros(active.size, dtype=bool)
+        empty = batch_values == 0
+
+        #Placed digits of every unit; fewer digits than placed cells means a repeat
+        placed = np.where(empty, 0, batch_candidates)
+        unit_placed = placed[:, UNIT_CELLS]
+        unit_used = np.bitwise_or.reduce(unit_placed, axis=2)
+        batch_failed |= (POPCOUNT_TABLE[unit_used] < (unit_placed != 0).sum(axis=2)).any(axis=1)
+
+        seen = np.bitwise_or.reduce(unit_used[:, CELL_UNITS], axis=2)
+        batch_candidates = np.where(empty, batch_candidates & ~seen, batch_candidates)
+
+        #Hidden singles: a digit with one place left in a unit is narrowed down to that cell, and picked up
+        #as a naked single below. Two digits narrowing the same cell leave it empty, which is a contradiction
+        unit_empty = empty[:, UNIT_CELLS]
+        for digit in range(1, 10):
+            digit_mask = DIGIT_MASKS[digit]
+            has_digit = ((batch_candidates[:, UNIT_CELLS] & digit_mask) != 0) & unit_empty
+            counts = has_digit.sum(axis=2)
+            batch_failed |= ((counts == 0) & ((unit_used & digit_mask) == 0)).any(axis=1)
+
+            puzzles, units = np.nonzero(counts == 1)
+            if puzzles.size:
+                cells = UNIT_CELLS[units, has_digit[puzzles, units].argmax(axis=1)]
+                np.bitwise_and.at(batch_candidates, (puzzles, cells), digit_mask)
+
+        batch_failed |= (batch_candidates == 0).any(axis=1)
+
+        singles = empty & (POPCOUNT_TABLE[batch_candidates] == 1) & ~batch_failed[:, None]
+        batch_values[singles] = LOWEST_DIGIT_TABLE[batch_candidates[singles]]
+
+        values[active] = batch_values
+        candidates[active] = batch_candidates
+        failed[active] = batch_failed
+
+        #Only puzzles that placed something can make further progress
+        active = active[singles.any(axis=1) & ~batch_failed]
+    return failed
+
+
+def solve_scalar(values, engine=SolverEngineEnum.BACKTRACKING):
+    #Solve one flat list of 81 values with solver.solve, returns the solved values or None
+    board_values = [list(values[row * 9:(row + 1) * 9]) for row in range(9)]
+    solved_board = solver.solve(predefined_sudoku_utils.create_sudoku_board(board_values, {}), engine=engine)
+    return list(solved_board.values) if solved_board else None
+
+
+def solve_batch(puzzles, engine=SolverEngineEnum.BACKTRACKING):
+    #Solve a sequence of classic puzzles given as flat lists of 81 values (0 for empty cells).
+    #Returns the solved values per puzzle, None for puzzles without a solution.
+    #engine is used for the puzzles singles cannot finish
+    if np is None:
+        return [solve_scalar(values, engine) for values in puzzles]
+
+    values = np.array(puzzles, dtype=np.uint8).reshape(-1, 81)
+    if values.shape[0] == 0:
+        return []
+    candidates = np.where(values == 0, ALL_DIGITS, DIGIT_MASK_TABLE[values]).astype(np.uint16)
+    failed = propagate_batch(values, candidates)
+    solved = (values != 0).all(axis=1) & ~failed
+
+    results = []
+    for index in range(values.shape[0]):
+        if failed[index]:
+            results.append(None)
+        elif solved[index]:
+            results.append(values[index].tolist())
+        else:
+            #Stalled, the deductions made so far are kept as givens
+            results.append(solve_scalar(values[index].tolist(), engine))
+    return results
@@ -0,0 +1,226 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import DancingLinks
+import predefined_sudoku_utils
+import puzzle_format
+import solver
+from enums import SolverEngineEnum
+from Heuristics import DomWdeg, MaxDegree
+from solver_stats import SolverStats
+from Strategies import StrategyPipeline, create_default_pipeline
+
+#Benchmarks every solver configuration over the predefined sudokus and the bundled corpora:
+#   python -m benchmark --repeat 5 --json baseline.json
+#   python -m benchmark --compare baseline.json
+#The second form exits with 1 if any puzzle got slower or needs more search nodes than in the baseline,
+#so it can gate changes to the solver and constraints.
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+
+#Timing differences below this are noise, whatever the tolerance
+MIN_REGRESSION_SECONDS = 0.002
+
+
+def all_strategies_pipeline():
+    pipeline = create_default_pipeline()
+    for strategy in pipeline.strategies:
+        strategy.enabled = True
+    return pipeline
+
+
+#Name -> (engine, factory for a fresh strategy pipeline, factory for a fresh cell heuristic)
+CONFIGURATIONS = {
+    'backtracking': (SolverEngineEnum.BACKTRACKING, lambda: StrategyPipeline([]), lambda: None),
+    'backtracking+default': (SolverEngineEnum.BACKTRACKING, create_default_pipeline, lambda: None),
+    'backtracking+all': (SolverEngineEnum.BACKTRACKING, all_strategies_pipeline, lambda: None),
+    'backtracking+degree': (SolverEngineEnum.BACKTRACKING, create_default_pipeline, MaxDegree),
+    'backtracking+dom_wdeg': (SolverEngineEnum.BACKTRACKING, create_default_pipeline, DomWdeg),
+    'dancing_links': (SolverEngineEnum.DANCING_LINKS, lambda: None, lambda: None),
+}
+
+
+def load_corpus(path):
+    #Yield (name, board) for every puzzle of a text corpus, a comment line right above a puzzle names it
+    corpus_name = os.path.splitext(os.path.basename(path))[0]
+    name = None
+    number = 0
+    with open(path, 'r') as corpus_file:
+        for line in corpus_file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('#'):
+                name = line[1:].strip()
+                continue
+
+            number += 1
+            board_values, constraints = puzzle_format.parse_puzzle_line(line)
+            board = predefined_sudoku_utils.create_sudoku_board(board_values, constraints)
+            yield f"{corpus_name}: {name or f'#{number}'}", board
+            name = None
+
+
+def load_puzzles(corpus_paths, include_predefined=True):
+    puzzles = []
+    if include_predefined:
+        for number, board in enumerate(predefined_sudoku_utils.create_predefined_sudokus(), start=1):
+            puzzles.append((f"predefined: #{number}", board))
+    for path in corpus_paths:
+        puzzles.extend(load_corpus(path))
+    return puzzles
+
+
+def run_solve(board, config_name):
+    engine, create_pipeline, create_heuristic = CONFIGURATIONS[config_name]
+    stats = SolverStats()
+    solved_board = solver.solve(board, strategies=create_pipeline(), engine=engine, stats=stats,
+                                heuristic=create_heuristic())
+    return solved_board, stats
+
+
+def benchmark_puzzle(puzzle_name, board, config_name, repeat):
+    #Returns the result row, or None if the configuration cannot handle the puzzle
+    engine = CONFIGURATIONS[config_name][0]
+    if engine == SolverEngineEnum.DANCING_LINKS and not DancingLinks.is_supported(board):
+        return None
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        solved_board, stats = run_solve(board, config_name)
+        times.append(time.perf_counter() - start)
+
+    #Memory is measured in a separate run, tracing slows the solver down too much to time it at the same time
+    tracemalloc.start()
+    try:
+        run_solve(board, config_name)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'puzzle': puzzle_name,
+        'config': config_name,
+        'solved': solved_board is not None,
+        'times': times,
+        'median_time': statistics.median(times),
+        'min_time': min(times),
+        'nodes': stats.nodes,
+        'max_depth': stats.max_depth,
+        'backtracks': stats.backtracks,
+        'propagations': stats.propagations,
+        'constraint_types': stats.as_dict()['constraint_types'],
+        'peak_memory': peak_memory,
+    }
+
+
+def run_benchmarks(puzzles, config_names, repeat, progress=None):
+    results = []
+    for puzzle_name, board in puzzles:
+        for config_name in config_names:
+            result = benchmark_puzzle(puzzle_name, board, config_name, repeat)
+            if result is not None:
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    return results
+
+
+def format_table(results):
+    headers = ('puzzle', 'config', 'solved', 'median ms', 'min ms', 'nodes', 'depth', 'backtracks', 'propagations', 'peak KiB')
+    rows = [
+        (
+            result['puzzle'],
+            result['config'],
+            'yes' if result['solved'] else 'NO',
+            f"{result['median_time'] * 1000:.2f}",
+            f"{result['min_time'] * 1000:.2f}",
+            str(result['nodes']),
+            str(result['max_depth']),
+            str(result['backtracks']),
+            str(result['propagations']),
+            f"{result['peak_memory'] / 1024:.1f}",
+        )
+        for result in results
+    ]
+
+    widths = [max(len(row[column]) for row in rows + [headers]) for column in range(len(headers))]
+    lines = ['  '.join(header.ljust(width) for header, width in zip(headers, widths))]
+    lines.append('  '.join('-' * width for width in widths))
+    for row in rows:
+        #Text columns left aligned, numbers right aligned
+        lines.append('  '.join(cell.ljust(width) if column < 3 else cell.rjust(width)
+                               for column, (cell, width) in enumerate(zip(row, widths))))
+    return '\n'.join(lines)
+
+
+def find_regressions(results, baseline, tolerance):
+    #Compare against the results of an earlier --json run, puzzles missing from either side are ignored
+    baseline_results = {(result['puzzle'], result['config']): result for result in baseline['results']}
+
+    regressions = []
+    for result in results:
+        old = baseline_results.get((result['puzzle'], result['config']))
+        if old is None:
+            continue
+
+        label = f"{result['puzzle']} [{result['config']}]"
+        if old['solved'] and not result['solved']:
+            regressions.append(f"{label}: no longer solved")
+        if result['nodes'] > old['nodes']:
+            regressions.append(f"{label}: nodes {old['nodes']} -> {result['nodes']}")
+        #The fastest run is the least disturbed by whatever else the machine is doing
+        slowdown = result['min_time'] - old['min_time']
+        if slowdown > MIN_REGRESSION_SECONDS and result['min_time'] > old['min_time'] * (1 + tolerance):
+            regressions.append(f"{label}: min {old['min_time'] * 1000:.2f}ms -> {result['min_time'] * 1000:.2f}ms")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='benchmark', description="Benchmark the Sudoku solver configurations")
+    parser.add_argument('corpora', nargs='*', help="Puzzle files, one puzzle per line, defaults to every file in benchmarks/")
+    parser.add_argument('-c', '--config', action='append', choices=list(CONFIGURATIONS),
+                        help="Configuration to run, may be repeated, defaults to all of them")
+    parser.add_argument('-n', '--repeat', type=int, default=3, help="Timed runs per puzzle and configuration")
+    parser.add_argument('--no-predefined', action='store_true', help="Skip the puzzles in predefined_sudokus.jsonl")
+    parser.add_argument('--json', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run, exit with 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown when comparing")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    corpus_paths = args.corpora or sorted(glob.glob(os.path.join(BENCHMARKS_DIR, '*.txt')))
+    config_names = args.config or list(CONFIGURATIONS)
+
+    puzzles = load_puzzles(corpus_paths, include_predefined=not args.no_predefined)
+    results = run_benchmarks(puzzles, config_names, args.repeat,
+                             progress=lambda result: print('.', end='', file=sys.stderr, flush=True))
+    print(file=sys.stderr)
+    print(format_table(results))
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'repeat': args.repeat, 'results': results}, json_file, indent=4)
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
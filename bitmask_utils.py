@@ -0,0 +1,30 @@
+#Candidate digits are stored as 9-bit integers: bit (d - 1) is set when digit d is still possible.
+#All tables are indexed directly by the mask so the hot loops never build sets.
+
+ALL_DIGITS = 0x1FF
+
+#DIGIT_MASKS[d] is the single-bit mask of digit d, DIGIT_MASKS[0] is 0 so empty cells can be OR'd in freely
+DIGIT_MASKS = [0] + [1 << (digit - 1) for digit in range(1, 10)]
+
+#Number of candidates left in a mask
+POPCOUNT = [bin(mask).count('1') for mask in range(ALL_DIGITS + 1)]
+
+#Smallest digit in a mask (0 for the empty mask)
+LOWEST_DIGIT = [0] + [(mask & -mask).bit_length() for mask in range(1, ALL_DIGITS + 1)]
+
+#Digits contained in a mask, in increasing order
+MASK_DIGITS = [tuple(digit for digit in range(1, 10) if mask & DIGIT_MASKS[digit]) for mask in range(ALL_DIGITS + 1)]
+
+#Sum of the digits contained in a mask
+MASK_SUM = [sum(digits) for digits in MASK_DIGITS]
+
+
+def digits_to_mask(digits):
+    mask = 0
+    for digit in digits:
+        mask |= DIGIT_MASKS[digit]
+    return mask
+
+
+def mask_to_digits(mask):
+    return set(MASK_DIGITS[mask])
@@ -17,6 +17,7 @@ class GUIState(Enum):
     SOLVING = 'solving' #While the solver is running
     SOLVED = 'solved' #After the board has been successfully solved
     INCORRECT_SOLVE = 'incorrect_solve' #After the solver fails to solve the board
+    SOLVE_CANCELLED = 'solve_cancelled' #After the user cancels a running solve
     EDITED = 'edited' #When the user is manually editing the board
     LOADING_SUDOKU = 'loading_sudoku' #When the user is loading a predefined sudoku
     ADDING_CONSTRAINTS = 'adding_constraints' #When the user is adding constraints to the board
@@ -26,6 +27,7 @@ class GUIState(Enum):
 
 class GUIButtons(Enum):
     SOLVE = 'solve'
+    CANCEL_SOLVE = 'cancel_solve'
     CLEAR = 'clear'
     LOAD_SUDOKU = 'load_sudoku'
     LEFT_ARROW = 'left_arrow'
@@ -37,4 +39,20 @@ class GUIButtons(Enum):
     DONE_ADDING_CONSTRAINTS = 'done_adding_constrains'
     ADD_SELECTED_CONSTRAINT = 'add_selected_constraint'
     CANCEL_SELECTED_CONSTRAINT = 'cancel_selected_constraint'
-    SAVE = 'SAVE'
\ No newline at end of file
+    SAVE = 'SAVE'
+
+class SolverEngineEnum(Enum):
+    BACKTRACKING = 'backtracking' #Constraint propagation with MRV backtracking, supports every constraint type
+    DANCING_LINKS = 'dancing_links' #Exact cover with Algorithm X, only row/column/box and killer cage constraints
+
+class DifficultyEnum(Enum):
+    EASY = 'easy' #Solved without undoing a single guess
+    MEDIUM = 'medium'
+    HARD = 'hard'
+    EXPERT = 'expert'
+
+class SolveStatusEnum(Enum):
+    SOLVED = 'solved' #A solution was found
+    UNSATISFIABLE = 'unsatisfiable' #The whole search ran without finding a solution
+    BUDGET_EXHAUSTED = 'budget_exhausted' #A time, node or memory limit ended the search first
+    CANCELLED = 'cancelled' #The cancel event ended the search first
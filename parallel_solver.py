@@ -0,0 +1,180 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import solver
+from bitmask_utils import MASK_DIGITS
+from Strategies import create_default_pipeline
+
+#Solves a single hard puzzle on every core by splitting its search tree:
+#   solved_board = parallel_solver.parallel_solve(sudoku_board, workers=8)
+#The tree is expanded breadth first, branching on the MRV cell, until it has a frontier of several subproblems
+#per worker. Each subproblem is the list of guesses leading to it, so only a few (index, value) pairs are sent
+#per task; the board itself is sent once per worker process. Workers take the next subproblem from the pool's
+#queue as soon as they are done, so the ones that drew easy branches pick up the remaining work. A shared event
+#stops every worker as soon as a solution is found, or once enough solutions have been counted.
+
+#Subproblems per worker, more balances the load better at the price of a longer sequential split
+SUBPROBLEMS_PER_WORKER = 8
+
+#How often the pool is checked for an external cancel while waiting, in seconds
+CANCEL_POLL_INTERVAL = 0.1
+
+#Per process state, set by _init_worker
+_worker_board = None
+_worker_strategies = None
+_worker_stop_event = None
+
+
+def replay_guesses(sudoku_board, guesses):
+    #Assign each (index, value) guess in order, returns False if the board reached a contradiction
+    values = sudoku_board.values
+    for index, value in guesses:
+        if values[index] != 0:
+            #Already filled by the propagation of an earlier guess
+            if values[index] != value:
+                return False
+        elif not sudoku_board.assign(index, value):
+            return False
+    return True
+
+
+def split_search(sudoku_board, num_subproblems, strategies=None):
+    #Expand the search tree breadth first until the frontier holds at least num_subproblems open nodes.
+    #Returns (frontier as lists of guesses, values of the solutions met while expanding).
+    #The board is left as it was given
+    frontier = deque([()])
+    solutions = []
+    while frontier and len(frontier) < num_subproblems:
+        guesses = frontier.popleft()
+        mark = sudoku_board.mark()
+        consistent = replay_guesses(sudoku_board, guesses)
+        if consistent and strategies is not None:
+            consistent = strategies.run(sudoku_board)
+
+        cell = None
+        if consistent:
+            if sudoku_board.is_solved():
+                solutions.append(list(sudoku_board.values))
+            else:
+                cell = sudoku_board.find_least_num_possible_cell()
+        if cell is not None:
+            for value in MASK_DIGITS[cell.candidates]:
+                frontier.append(guesses + ((cell.index, value),))
+        sudoku_board.undo(mark)
+    return list(frontier), solutions
+
+
+def _init_worker(sudoku_board, strategies, stop_event):
+    global _worker_board, _worker_strategies, _worker_stop_event
+    _worker_board = sudoku_board
+    _worker_strategies = strategies if strategies is not None else create_default_pipeline()
+    _worker_stop_event = stop_event
+
+
+def _solve_subproblem(guesses):
+    #Solution values of the subproblem, or None if it has none or the search was stopped
+    if _worker_stop_event.is_set():
+        return None
+    mark = _worker_board.mark()
+    try:
+        if not replay_guesses(_worker_board, guesses):
+            return None
+        solved_board = solver.recursive_solve(_worker_board, strategies=_worker_strategies, cancel_event=_worker_stop_event)
+        return list(solved_board.values) if solved_board else None
+    finally:
+        _worker_board.undo(mark)
+
+
+def _count_subproblem(guesses, limit):
+    if _worker_stop_event.is_set():
+        return 0
+    mark = _worker_board.mark()
+    try:
+        if not replay_guesses(_worker_board, guesses):
+            return 0
+        return solver.recursive_count(_worker_board, limit, _worker_strategies, cancel_event=_worker_stop_event)
+    finally:
+        _worker_board.undo(mark)
+
+
+def _run_pool(sudoku_board, strategies, workers, submit_tasks, on_result, cancel_event):
+    #Runs the tasks submitted by submit_tasks(executor) until on_result returns True for a result,
+    #every task has finished or cancel_event is set. Returns False if it was cancelled
+    context = multiprocessing.get_context()
+    stop_event = context.Event()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(sudoku_board, strategies, stop_event)) as executor:
+        pending = set(submit_tasks(executor))
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if on_result(future.result()):
+                        return True
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+            return True
+        finally:
+            #Tasks that have not started are dropped, running ones see the event at their next node
+            stop_event.set()
+            for future in pending:
+                future.cancel()
+
+
+def parallel_solve(sudoku_board, workers=None, strategies=None, cancel_event=None,
+                   subproblems_per_worker=SUBPROBLEMS_PER_WORKER):
+    #Same result as solver.solve with the backtracking engine, the original board is not modified.
+    #strategies is a picklable StrategyPipeline, the default pipeline is used when None.
+    #cancel_event is an optional threading.Event, every worker gives up as soon as it is set
+    workers = workers or multiprocessing.cpu_count()
+    board = sudoku_board.clone()
+    if not board.propagate(board.constraints):
+        return None
+
+    frontier, solutions = split_search(board, workers * subproblems_per_worker,
+                                       strategies if strategies is not None else create_default_pipeline())
+    if not solutions and frontier:
+        found = []
+
+        def on_result(values):
+            if values is None:
+                return False
+            found.append(values)
+            return True
+
+        _run_pool(board, strategies, workers,
+                  lambda executor: [executor.submit(_solve_subproblem, guesses) for guesses in frontier],
+                  on_result, cancel_event)
+        solutions = found
+
+    if not solutions:
+        return None
+    for index, value in enumerate(solutions[0]):
+        if board.values[index] == 0:
+            board.place_value(index, value)
+    return board
+
+
+def parallel_count_solutions(sudoku_board, limit=2, workers=None, strategies=None, cancel_event=None,
+                             subproblems_per_worker=SUBPROBLEMS_PER_WORKER):
+    #Same as solver.count_solutions with the backtracking engine, the counts of all subproblems are added up
+    #and the workers are stopped as soon as the total reaches limit. A cancelled count is only a lower bound
+    workers = workers or multiprocessing.cpu_count()
+    board = sudoku_board.clone()
+    if not board.propagate(board.constraints):
+        return 0
+
+    frontier, solutions = split_search(board, workers * subproblems_per_worker,
+                                       strategies if strategies is not None else create_default_pipeline())
+    total = len(solutions)
+    if total < limit and frontier:
+        def on_result(count):
+            nonlocal total
+            total += count
+            return total >= limit
+
+        _run_pool(board, strategies, workers,
+                  lambda executor: [executor.submit(_count_subproblem, guesses, limit) for guesses in frontier],
+                  on_result, cancel_event)
+    return min(total, limit)
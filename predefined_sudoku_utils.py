@@ -1,92 +1,126 @@
-import json
+import os
+from collections import OrderedDict
 
 from Constraints import *
 from enums import *
+from puzzle_store import PuzzleStore
 from SudokuBoard import SudokuBoard
 
-PREDEFINED_SUDOKUS_FILE = "predefined_sudokus.json"
+#Next to the module, so the predefined sudokus are found whatever the working directory is
+PREDEFINED_SUDOKUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "predefined_sudokus.jsonl")
+PREDEFINED_BOARD_CACHE_SIZE = 16
+
+def open_predefined_store():
+    #Raises PuzzleStoreError if the predefined sudokus file is missing
+    return PuzzleStore(PREDEFINED_SUDOKUS_FILE, create=False)
 
 def create_predefined_sudokus():
     #Return a list of SudokueBoard objects so that we cna loop through them with Load Sudoku button
     loaded_sudokus = []
-    with open(PREDEFINED_SUDOKUS_FILE, 'r') as data:
-        sudoku_data = json.load(data)
-        predefined_sudokus = sudoku_data['predefined_sudokus']
-
-        for predefined_sudoku in predefined_sudokus:
-            sudoku_board = SudokuBoard()
-            for row in range(9):
-                for col in range(9):
-                    value = predefined_sudoku['board'][row][col]
-                    if value != 0:
-                        sudoku_board.board[row][col].set_value(value)
-
-            for constraint_type, constraint in predefined_sudoku['constraints'].items():
-                match constraint_type:
-                    case ConstraintsEnum.WHITE_KROPKI_DOT.value:
-                        for affected_cells in constraint:
-                            cell1_row, cell1_col = affected_cells[0]
-                            cell2_row, cell2_col = affected_cells[1]
-
-                            cell1 = sudoku_board.board[cell1_row][cell1_col]
-                            cell2 = sudoku_board.board[cell2_row][cell2_col]
-
-                            new_constraint = KropkiDotConstraint(
-                                cells=[cell1, cell2],
-                                type=KropkiTypeEnum.WHITE_DOT
-                            )
-
-                            sudoku_board.constraints.append(new_constraint)
-                            cell1.add_constraint(new_constraint)
-                            cell2.add_constraint(new_constraint)
-
-                    case ConstraintsEnum.BLACK_KROPKI_DOT.value:
-                        for affected_cells in constraint:
-                            cell1_row, cell1_col = affected_cells[0]
-                            cell2_row, cell2_col = affected_cells[1]
-
-                            cell1 = sudoku_board.board[cell1_row][cell1_col]
-                            cell2 = sudoku_board.board[cell2_row][cell2_col]
-
-                            new_constraint = KropkiDotConstraint(
-                                cells=[cell1, cell2],
-                                type=KropkiTypeEnum.BLACK_DOT
-                            )
-
-                            sudoku_board.constraints.append(new_constraint)
-                            cell1.add_constraint(new_constraint)
-                            cell2.add_constraint(new_constraint)
-                    case ConstraintsEnum.KILLER_CAGE.value:
-                        print("IMPLEMENT FUNCTIONALITY TO LOAD KILLER AGE CONSTRAINTS")
-                    case _:
-                        continue
-
-            loaded_sudokus.append(sudoku_board)
+    for predefined_sudoku in open_predefined_store():
+        loaded_sudokus.append(create_sudoku_board(predefined_sudoku['board'], predefined_sudoku['constraints']))
     return loaded_sudokus
 
-def save_predefined_sudoku(board_values, board_constraints):
-    new_predefined_sudoku = {
-        'board': board_values,
-        'constraints': board_constraints
-    }
-
-    try:
-        with open(PREDEFINED_SUDOKUS_FILE, 'r') as data:
-            sudoku_data = json.load(data)
-        
-        sudoku_data['predefined_sudokus'].append(new_predefined_sudoku)
-
-        with open(PREDEFINED_SUDOKUS_FILE, 'w') as data:
-            json.dump(sudoku_data, data, indent=4)
-
-
-        sudoku_board = SudokuBoard()
-        for row in range(9):
-            for col in range(9):
-                value = new_predefined_sudoku['board'][row][col]
-                if value != 0:
-                    sudoku_board.board[row][col].set_value(value)
-        return True
-    except Exception as e:
-        return False
-    
+class PredefinedSudokus():
+    #Predefined sudokus by position, each board is only built when it is first asked for and the most recently
+    #used ones are kept, so nothing but the store's index is loaded up front
+    def __init__(self, store, cache_size=PREDEFINED_BOARD_CACHE_SIZE):
+        self.store = store
+        self.cache_size = cache_size
+        self.boards = OrderedDict() #Puzzle id -> SudokuBoard, least recently used first
+
+    def __len__(self):
+        return len(self.store)
+
+    def get_board(self, index):
+        #The shared built board, callers that modify it must copy it first
+        puzzle_id = self.store.ids[index]
+        board = self.boards.get(puzzle_id)
+        if board is not None:
+            self.boards.move_to_end(puzzle_id)
+            return board
+
+        entry = self.store.get(puzzle_id)
+        board = create_sudoku_board(entry['board'], entry['constraints'])
+        self.boards[puzzle_id] = board
+        if len(self.boards) > self.cache_size:
+            self.boards.popitem(last=False)
+        return board
+
+def create_sudoku_board(board_values, board_constraints):
+    #Build a SudokuBoard from a 9x9 list of values and a dict of constraints in the predefined sudoku format
+    sudoku_board = SudokuBoard()
+    for row in range(9):
+        for col in range(9):
+            value = board_values[row][col]
+            if value != 0:
+                sudoku_board.board[row][col].set_value(value)
+
+    for constraint_type, constraint in board_constraints.items():
+        match constraint_type:
+            case ConstraintsEnum.WHITE_KROPKI_DOT.value:
+                for affected_cells in constraint:
+                    cell1_row, cell1_col = affected_cells[0]
+                    cell2_row, cell2_col = affected_cells[1]
+
+                    cell1 = sudoku_board.board[cell1_row][cell1_col]
+                    cell2 = sudoku_board.board[cell2_row][cell2_col]
+
+                    new_constraint = KropkiDotConstraint(
+                        cells=[cell1, cell2],
+                        type=KropkiTypeEnum.WHITE_DOT
+                    )
+
+                    sudoku_board.constraints.append(new_constraint)
+                    cell1.add_constraint(new_constraint)
+                    cell2.add_constraint(new_constraint)
+
+            case ConstraintsEnum.BLACK_KROPKI_DOT.value:
+                for affected_cells in constraint:
+                    cell1_row, cell1_col = affected_cells[0]
+                    cell2_row, cell2_col = affected_cells[1]
+
+                    cell1 = sudoku_board.board[cell1_row][cell1_col]
+                    cell2 = sudoku_board.board[cell2_row][cell2_col]
+
+                    new_constraint = KropkiDotConstraint(
+                        cells=[cell1, cell2],
+                        type=KropkiTypeEnum.BLACK_DOT
+                    )
+
+                    sudoku_board.constraints.append(new_constraint)
+                    cell1.add_constraint(new_constraint)
+                    cell2.add_constraint(new_constraint)
+            case ConstraintsEnum.KILLER_CAGE.value:
+                #Each cage is {"cells": [[row, col], ...], "sum": target}
+                for cage in constraint:
+                    cells = [sudoku_board.board[row][col] for row, col in cage['cells']]
+
+                    new_constraint = KillerCageConstraint(cells, cage['sum'])
+
+                    sudoku_board.constraints.append(new_constraint)
+                    for cell in cells:
+                        cell.add_constraint(new_constraint)
+            case _:
+                continue
+
+    return sudoku_board
+
+def parse_sudoku_line(line):
+    #Parse an 81 character line, row by row, with 0 or . for empty cells into a 9x9 list of values
+    line = line.strip()
+    if len(line) != 81:
+        raise ValueError(f"Expected 81 characters, got {len(line)}")
+
+    values = [0 if char in '0.' else int(char) for char in line]
+    return [values[row * 9:(row + 1) * 9] for row in range(9)]
+
+def format_sudoku_line(values):
+    #Inverse of parse_sudoku_line for a flat list of 81 values
+    return ''.join(str(value) for value in values)
+
+def save_predefined_sudoku(board_values, board_constraints, store=None):
+    #Append the puzzle to the predefined sudokus and return its id, raises PuzzleStoreError if it could not be saved
+    if store is None:
+        store = open_predefined_store()
+    return store.append(board_values, board_constraints)
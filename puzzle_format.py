@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import struct
+import sys
+
+import predefined_sudoku_utils
+from enums import ConstraintsEnum
+from puzzle_store import PuzzleStore
+
+#Compact puzzle corpus formats, both streamed one puzzle at a time so corpora never have to fit in memory.
+#Puzzles are passed around as (board_values, constraints) in the predefined sudoku format: a 9x9 list of values
+#and a dict of constraint lists keyed by ConstraintsEnum value.
+#
+#Line format (.txt), one puzzle per line, blank lines and lines starting with # are skipped:
+#   <81 characters, 0 or . for empty cells>[ <constraint>;<constraint>;...]
+#with every cell written as its flat index row * 9 + col:
+#   w<cell>-<cell>              white Kropki dot
+#   b<cell>-<cell>              black Kropki dot
+#   k<sum>:<cell>,<cell>,...    killer cage
+#
+#Packed binary format (.sdkb): a 4 byte header, then one record per puzzle:
+#   uint16 length of the rest of the record
+#   41 bytes of values, two cells per byte (high nibble first)
+#   uint16 number of constraints, then per constraint a type byte and its cells:
+#       0 white dot / 1 black dot: 2 cell bytes
+#       2 killer cage: sum byte, size byte, size cell bytes
+#
+#.json files are in the predefined sudoku format and .jsonl files are puzzle stores (see puzzle_store).
+
+BINARY_MAGIC = b'SDK\x01'
+BINARY_EXTENSION = '.sdkb'
+JSON_EXTENSION = '.json'
+STORE_EXTENSION = '.jsonl'
+
+_DOT_TYPES = ((ConstraintsEnum.WHITE_KROPKI_DOT.value, 'w', 0), (ConstraintsEnum.BLACK_KROPKI_DOT.value, 'b', 1))
+_CAGE_TYPE = 2
+
+
+def _flat(cell):
+    row, col = cell
+    return row * 9 + col
+
+
+def _cell(index):
+    if not 0 <= index < 81:
+        raise ValueError(f"Cell index {index} is outside the board")
+    return [index // 9, index % 9]
+
+
+def format_puzzle_line(board_values, constraints):
+    line = predefined_sudoku_utils.format_sudoku_line([value for row in board_values for value in row])
+
+    tokens = []
+    for constraint_type, prefix, _ in _DOT_TYPES:
+        for cell1, cell2 in constraints.get(constraint_type, []):
+            tokens.append(f"{prefix}{_flat(cell1)}-{_flat(cell2)}")
+    for cage in constraints.get(ConstraintsEnum.KILLER_CAGE.value, []):
+        tokens.append(f"k{cage['sum']}:" + ','.join(str(_flat(cell)) for cell in cage['cells']))
+
+    if tokens:
+        line += ' ' + ';'.join(tokens)
+    return line
+
+
+def parse_puzzle_line(line):
+    #Inverse of format_puzzle_line, raises ValueError on malformed input
+    grid, _, constraint_section = line.strip().partition(' ')
+    board_values = predefined_sudoku_utils.parse_sudoku_line(grid)
+
+    constraints = {}
+    dot_types = {prefix: constraint_type for constraint_type, prefix, _ in _DOT_TYPES}
+    for token in constraint_section.split(';'):
+        token = token.strip()
+        if not token:
+            continue
+        if token[0] in dot_types:
+            index1, index2 = token[1:].split('-')
+            constraints.setdefault(dot_types[token[0]], []).append([_cell(int(index1)), _cell(int(index2))])
+        elif token[0] == 'k':
+            target, cells = token[1:].split(':')
+            constraints.setdefault(ConstraintsEnum.KILLER_CAGE.value, []).append({
+                'cells': [_cell(int(index)) for index in cells.split(',')],
+                'sum': int(target),
+            })
+        else:
+            raise ValueError(f"Unknown constraint: {token}")
+    return board_values, constraints
+
+
+def pack_puzzle(board_values, constraints):
+    values = [value for row in board_values for value in row] + [0]
+    record = bytearray((values[i] << 4) | values[i + 1] for i in range(0, 82, 2))
+
+    packed_constraints = []
+    for constraint_type, _, type_code in _DOT_TYPES:
+        for cell1, cell2 in constraints.get(constraint_type, []):
+            packed_constraints.append(bytes((type_code, _flat(cell1), _flat(cell2))))
+    for cage in constraints.get(ConstraintsEnum.KILLER_CAGE.value, []):
+        packed_constraints.append(bytes([_CAGE_TYPE, cage['sum'], len(cage['cells'])] + [_flat(cell) for cell in cage['cells']]))
+
+    record += struct.pack('<H', len(packed_constraints))
+    for packed in packed_constraints:
+        record += packed
+    return struct.pack('<H', len(record)) + bytes(record)
+
+
+def unpack_puzzle(record):
+    #record is everything after the length prefix, raises ValueError if it is cut short
+    if len(record) < 43:
+        raise ValueError(f"Puzzle record of {len(record)} bytes is shorter than the 43 byte header")
+    values = []
+    for byte in record[:41]:
+        values.append(byte >> 4)
+        values.append(byte & 0xF)
+    board_values = [values[row * 9:(row + 1) * 9] for row in range(9)]
+
+    constraints = {}
+    dot_types = {type_code: constraint_type for constraint_type, _, type_code in _DOT_TYPES}
+    (num_constraints,) = struct.unpack_from('<H', record, 41)
+    position = 43
+    for _ in range(num_constraints):
+        if position + 3 > len(record):
+            raise ValueError("Puzzle record ends in the middle of its constraints")
+        type_code = record[position]
+        if type_code in dot_types:
+            cells = [_cell(record[position + 1]), _cell(record[position + 2])]
+            constraints.setdefault(dot_types[type_code], []).append(cells)
+            position += 3
+        elif type_code == _CAGE_TYPE:
+            target, size = record[position + 1], record[position + 2]
+            if position + 3 + size > len(record):
+                raise ValueError("Puzzle record ends in the middle of its constraints")
+            cells = [_cell(index) for index in record[position + 3:position + 3 + size]]
+            constraints.setdefault(ConstraintsEnum.KILLER_CAGE.value, []).append({'cells': cells, 'sum': target})
+            position += 3 + size
+        else:
+            raise ValueError(f"Unknown constraint type {type_code}")
+    return board_values, constraints
+
+
+def iter_line_puzzles(path):
+    with open(path, 'r') as puzzle_file:
+        for line in puzzle_file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield parse_puzzle_line(line)
+
+
+def iter_binary_puzzles(path):
+    with open(path, 'rb') as puzzle_file:
+        if puzzle_file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{path} is not a packed puzzle file")
+        while True:
+            prefix = puzzle_file.read(2)
+            if not prefix:
+                return
+            if len(prefix) != 2:
+                raise ValueError(f"{path} ends in the middle of a puzzle")
+            (length,) = struct.unpack('<H', prefix)
+            record = puzzle_file.read(length)
+            if len(record) != length:
+                raise ValueError(f"{path} ends in the middle of a puzzle")
+            yield unpack_puzzle(record)
+
+
+def iter_json_puzzles(path):
+    #JSON has to be parsed whole, only the board building is lazy
+    with open(path, 'r') as puzzle_file:
+        sudoku_data = json.load(puzzle_file)
+    for puzzle in sudoku_data['predefined_sudokus']:
+        yield puzzle['board'], puzzle['constraints']
+
+
+def iter_puzzles(path):
+    #Yield (board_values, constraints) for every puzzle of a file, the format is picked from its extension
+    extension = os.path.splitext(path)[1].lower()
+    if extension == BINARY_EXTENSION:
+        return iter_binary_puzzles(path)
+    if extension == JSON_EXTENSION:
+        return iter_json_puzzles(path)
+    if extension == STORE_EXTENSION:
+        return ((entry['board'], entry['constraints']) for entry in PuzzleStore(path, create=False))
+    return iter_line_puzzles(path)
+
+
+def iter_boards(path):
+    #Yield a SudokuBoard per puzzle, each one only built when it is asked for
+    for board_values, constraints in iter_puzzles(path):
+        yield predefined_sudoku_utils.create_sudoku_board(board_values, constraints)
+
+
+def write_puzzles(path, puzzles):
+    #Write an iterable of (board_values, constraints) in the format picked from the extension, returns the count
+    extension = os.path.splitext(path)[1].lower()
+    count = 0
+    if extension == BINARY_EXTENSION:
+        with open(path, 'wb') as puzzle_file:
+            puzzle_file.write(BINARY_MAGIC)
+            for board_values, constraints in puzzles:
+                puzzle_file.write(pack_puzzle(board_values, constraints))
+                count += 1
+    elif extension == STORE_EXTENSION:
+        #Appends to an existing store, puzzles it already has are skipped
+        entry_ids = PuzzleStore(path).append_many((board_values, constraints, {}) for board_values, constraints in puzzles)
+        count = len(entry_ids)
+    elif extension == JSON_EXTENSION:
+        entries = [{'board': board_values, 'constraints': constraints} for board_values, constraints in puzzles]
+        with open(path, 'w') as puzzle_file:
+            json.dump({'predefined_sudokus': entries}, puzzle_file, indent=4)
+        count = len(entries)
+    else:
+        with open(path, 'w') as puzzle_file:
+            for board_values, constraints in puzzles:
+                puzzle_file.write(format_puzzle_line(board_values, constraints) + '\n')
+                count += 1
+    return count
+
+
+def convert(source_path, destination_path):
+    return write_puzzles(destination_path, iter_puzzles(source_path))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='puzzle_format', description="Convert puzzle corpora between formats")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help="Convert between .json, .jsonl, .sdkb and line (.txt) files")
+    convert_parser.add_argument('source')
+    convert_parser.add_argument('destination')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    count = convert(args.source, args.destination)
+    print(f"Converted {count} puzzles", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
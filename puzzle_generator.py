@@ -0,0 +1,231 @@
+import argparse
+import json
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import predefined_sudoku_utils
+import solver
+from enums import ConstraintsEnum, DifficultyEnum, KropkiTypeEnum
+from solver_stats import SolverStats
+
+#Generates puzzles with a unique solution in the predefined sudoku format:
+#   python -m puzzle_generator -n 10 --difficulty hard --dots 12 --seed 42 -o puzzles.json
+#Every puzzle gets its own seed drawn from --seed, so the output is the same whatever the number of workers.
+
+#Difficulty is measured as the wrong guesses the default solver has to undo, inclusive (min, max), None for no maximum.
+#Nodes would also count branching on cells with a single candidate left, which is no harder for a person
+DIFFICULTY_BACKTRACKS = {
+    DifficultyEnum.EASY: (0, 0),
+    DifficultyEnum.MEDIUM: (1, 3),
+    DifficultyEnum.HARD: (4, 15),
+    DifficultyEnum.EXPERT: (16, None),
+}
+
+#Fresh solution grids tried per puzzle before giving up on the target difficulty
+MAX_ATTEMPTS = 20
+
+
+def random_solution(rng):
+    #Fill the three diagonal boxes at random (they never interact), let the solver complete the grid,
+    #then shuffle it with validity preserving transformations so the solver's digit order leaves no trace
+    values = [[0] * 9 for _ in range(9)]
+    for box in range(3):
+        digits = rng.sample(range(1, 10), 9)
+        for i, digit in enumerate(digits):
+            values[box * 3 + i // 3][box * 3 + i % 3] = digit
+    grid = solver.solve(predefined_sudoku_utils.create_sudoku_board(values, {})).values
+
+    relabel = [0] + rng.sample(range(1, 10), 9)
+    bands = rng.sample(range(3), 3)
+    stacks = rng.sample(range(3), 3)
+    rows = [band * 3 + row for band in bands for row in rng.sample(range(3), 3)]
+    cols = [stack * 3 + col for stack in stacks for col in rng.sample(range(3), 3)]
+    transpose = rng.random() < 0.5
+
+    solution = [[relabel[grid[rows[row] * 9 + cols[col]]] for col in range(9)] for row in range(9)]
+    if transpose:
+        solution = [list(column) for column in zip(*solution)]
+    return solution
+
+
+def random_kropki_dots(solution, rng, count):
+    #Up to count dots between neighbouring cells, taken from the pairs the solution allows
+    dots = []
+    for row in range(9):
+        for col in range(9):
+            for other_row, other_col in ((row, col + 1), (row + 1, col)):
+                if other_row > 8 or other_col > 8:
+                    continue
+                a, b = solution[row][col], solution[other_row][other_col]
+                cells = [[row, col], [other_row, other_col]]
+                #1 and 2 fit both dots
+                if abs(a - b) == 1:
+                    dots.append((KropkiTypeEnum.WHITE_DOT, cells))
+                if a == 2 * b or b == 2 * a:
+                    dots.append((KropkiTypeEnum.BLACK_DOT, cells))
+
+    rng.shuffle(dots)
+    constraints = {}
+    used_pairs = set()
+    for dot_type, cells in dots:
+        pair = tuple(map(tuple, cells))
+        if pair in used_pairs:
+            continue
+        used_pairs.add(pair)
+        constraints.setdefault(dot_type.value, []).append(cells)
+        if len(used_pairs) == count:
+            break
+    return constraints
+
+
+def random_killer_cages(solution, rng, max_size=4):
+    #Partition the grid into cages of 1 to max_size connected cells without repeated digits
+    unassigned = set((row, col) for row in range(9) for col in range(9))
+    cages = []
+    while unassigned:
+        start = min(unassigned)
+        unassigned.discard(start)
+        cage = [start]
+        size = rng.randint(1, max_size)
+        while len(cage) < size:
+            cage_digits = set(solution[row][col] for row, col in cage)
+            neighbours = sorted(set(
+                (row + d_row, col + d_col)
+                for row, col in cage
+                for d_row, d_col in ((0, 1), (1, 0), (0, -1), (-1, 0))
+                if (row + d_row, col + d_col) in unassigned and solution[row + d_row][col + d_col] not in cage_digits
+            ))
+            if not neighbours:
+                break
+            cell = rng.choice(neighbours)
+            unassigned.discard(cell)
+            cage.append(cell)
+        cages.append({
+            'cells': [[row, col] for row, col in cage],
+            'sum': sum(solution[row][col] for row, col in cage),
+        })
+    return cages
+
+
+def difficulty_score(board_values, constraints):
+    #Backtracks the default solver needs
+    stats = SolverStats()
+    solver.solve(predefined_sudoku_utils.create_sudoku_board(board_values, constraints), stats=stats)
+    return stats.backtracks
+
+
+def has_unique_solution(board_values, constraints):
+    board = predefined_sudoku_utils.create_sudoku_board(board_values, constraints)
+    return solver.count_solutions(board, limit=2) == 1
+
+
+def remove_givens(solution, constraints, rng, max_score):
+    #Take givens away in random order, keeping each removal only while the solution stays unique
+    #and the puzzle does not get harder than max_score
+    board_values = [list(row) for row in solution]
+    cells = [(row, col) for row in range(9) for col in range(9)]
+    rng.shuffle(cells)
+
+    score = difficulty_score(board_values, constraints)
+    for row, col in cells:
+        value = board_values[row][col]
+        board_values[row][col] = 0
+        if not has_unique_solution(board_values, constraints):
+            board_values[row][col] = value
+            continue
+
+        new_score = difficulty_score(board_values, constraints)
+        if max_score is not None and new_score > max_score:
+            board_values[row][col] = value
+            continue
+        score = new_score
+    return board_values, score
+
+
+def generate_puzzle(seed, difficulty=DifficultyEnum.MEDIUM, kropki_dots=0, killer_cages=False):
+    #Returns a predefined sudoku entry. If no attempt hits the target difficulty the closest one is returned,
+    #its 'difficulty' says what it actually is
+    rng = random.Random(seed)
+    min_score, max_score = DIFFICULTY_BACKTRACKS[difficulty]
+
+    best = None
+    for _ in range(MAX_ATTEMPTS):
+        solution = random_solution(rng)
+        constraints = {}
+        if kropki_dots:
+            constraints.update(random_kropki_dots(solution, rng, kropki_dots))
+        if killer_cages:
+            constraints[ConstraintsEnum.KILLER_CAGE.value] = random_killer_cages(solution, rng)
+
+        board_values, score = remove_givens(solution, constraints, rng, max_score)
+        puzzle = {
+            'board': board_values,
+            'constraints': constraints,
+            'difficulty': classify_difficulty(score).value,
+            'backtracks': score,
+            'seed': seed,
+        }
+        if score >= min_score:
+            return puzzle
+        if best is None or score > best['backtracks']:
+            best = puzzle
+    return best
+
+
+def classify_difficulty(score):
+    for difficulty, (min_score, max_score) in DIFFICULTY_BACKTRACKS.items():
+        if score >= min_score and (max_score is None or score <= max_score):
+            return difficulty
+    return DifficultyEnum.EASY
+
+
+def generate_puzzles(count, difficulty=DifficultyEnum.MEDIUM, seed=None, workers=None, kropki_dots=0, killer_cages=False):
+    #Yield count puzzles in order. Each one is generated from its own seed in a worker process
+    seed_rng = random.Random(seed)
+    seeds = [seed_rng.getrandbits(64) for _ in range(count)]
+
+    if workers == 1:
+        for puzzle_seed in seeds:
+            yield generate_puzzle(puzzle_seed, difficulty, kropki_dots, killer_cages)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(generate_puzzle, seeds, [difficulty] * count, [kropki_dots] * count, [killer_cages] * count)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='puzzle_generator', description="Generate Sudoku puzzles with a unique solution")
+    parser.add_argument('-n', '--count', type=int, default=1, help="Number of puzzles to generate")
+    parser.add_argument('-d', '--difficulty', default=DifficultyEnum.MEDIUM.value, choices=[difficulty.value for difficulty in DifficultyEnum])
+    parser.add_argument('--dots', type=int, default=0, help="Kropki dots to add to every puzzle")
+    parser.add_argument('--cages', action='store_true', help="Cover the grid with killer cages")
+    parser.add_argument('-s', '--seed', type=int, default=None, help="Seed for reproducible output")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Worker processes, defaults to the CPU count")
+    parser.add_argument('-o', '--output', default='-', help="JSON file in the predefined sudoku format, - for stdout")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    difficulty = DifficultyEnum(args.difficulty)
+
+    puzzles = []
+    for puzzle in generate_puzzles(args.count, difficulty, args.seed, args.workers, args.dots, args.cages):
+        puzzles.append(puzzle)
+        print(f"Generated puzzle {len(puzzles)}/{args.count} ({puzzle['difficulty']}, {puzzle['backtracks']} backtracks)", file=sys.stderr)
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        json.dump({'predefined_sudokus': puzzles}, output, indent=4)
+        output.write('\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    missed = sum(1 for puzzle in puzzles if puzzle['difficulty'] != difficulty.value)
+    return 0 if missed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+
+#Append-only puzzle library, one JSON object per line:
+#   {"id": "...", "board": [[...], ...], "constraints": {...}}
+#Saving a puzzle appends a single line, so it costs the same however big the library is, and only the byte offset
+#of every puzzle is kept in memory. Each line is written with a single write and fsynced; if a crash cuts the last
+#line short it is ignored when the store is opened and cut off before the next append.
+
+
+ID_PREFIX = b'{"id":"'
+
+
+class PuzzleStoreError(Exception):
+    pass
+
+
+def normalize_constraints(constraints):
+    #Drop empty constraint lists and turn cell tuples into lists, so equal puzzles serialise the same way
+    return json.loads(json.dumps({constraint_type: cells for constraint_type, cells in constraints.items() if cells}))
+
+
+def puzzle_id(board_values, constraints):
+    #Content hash, the same puzzle always gets the same id
+    canonical = json.dumps({'board': board_values, 'constraints': normalize_constraints(constraints)},
+                           sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+class PuzzleStore():
+    #create False is for readers that expect an existing store, a missing file then raises instead of reading as empty
+    def __init__(self, path, create=True):
+        self.path = path
+        self.create = create
+        self.offsets = {} #Puzzle id -> byte offset of its line
+        self.ids = [] #Puzzle ids in the order they were saved
+        self.valid_length = 0 #Bytes up to the end of the last complete line
+        self.load_index()
+
+    def load_index(self):
+        self.offsets = {}
+        self.ids = []
+        self.valid_length = 0
+        if not os.path.exists(self.path):
+            if not self.create:
+                raise PuzzleStoreError(f"Puzzle store {self.path} does not exist")
+            return
+
+        try:
+            with open(self.path, 'rb') as store_file:
+                offset = 0
+                for line_number, line in enumerate(store_file, start=1):
+                    if not line.endswith(b'\n'):
+                        #Torn write from a crash, everything before it is intact
+                        break
+                    if line.strip():
+                        entry_id = self.read_entry_id(line, line_number)
+                        if entry_id not in self.offsets:
+                            self.offsets[entry_id] = offset
+                            self.ids.append(entry_id)
+                    offset += len(line)
+                self.valid_length = offset
+        except OSError as e:
+            raise PuzzleStoreError(f"Could not read {self.path}: {e}") from e
+
+    def read_entry_id(self, line, line_number):
+        #Lines written by append start with the id, so opening a large store does not have to parse every puzzle
+        if line.startswith(ID_PREFIX):
+            end = line.find(b'"', len(ID_PREFIX))
+            if end != -1:
+                return line[len(ID_PREFIX):end].decode('ascii')
+        try:
+            return json.loads(line)['id']
+        except (ValueError, KeyError, TypeError) as e:
+            raise PuzzleStoreError(f"{self.path}:{line_number}: corrupt puzzle entry ({e})") from e
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, entry_id):
+        return entry_id in self.offsets
+
+    def get(self, entry_id):
+        #The stored entry for an id, raises KeyError for unknown ids
+        offset = self.offsets[entry_id]
+        try:
+            with open(self.path, 'rb') as store_file:
+                store_file.seek(offset)
+                return json.loads(store_file.readline())
+        except (OSError, ValueError) as e:
+            raise PuzzleStoreError(f"Could not read puzzle {entry_id} from {self.path}: {e}") from e
+
+    def __iter__(self):
+        #Stream every entry in save order without loading the whole file
+        try:
+            with open(self.path, 'rb') as store_file:
+                seen = set()
+                for line in store_file:
+                    if store_file.tell() > self.valid_length:
+                        break
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry['id'] in self.offsets and entry['id'] not in seen:
+                        seen.add(entry['id'])
+                        yield entry
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            raise PuzzleStoreError(f"Could not read {self.path}: {e}") from e
+
+    def append(self, board_values, constraints, **metadata):
+        #Save a puzzle and return its id. Saving a puzzle that is already stored only returns its id
+        return self.append_many([(board_values, constraints, metadata)])[0]
+
+    def append_many(self, puzzles):
+        #Save an iterable of (board_values, constraints, metadata) with a single fsync, returns their ids
+        entry_ids = []
+        new_offsets = {}
+        try:
+            with open(self.path, 'ab') as store_file:
+                if store_file.tell() != self.valid_length:
+                    store_file.truncate(self.valid_length)
+                offset = self.valid_length
+
+                for board_values, constraints, metadata in puzzles:
+                    entry_id = puzzle_id(board_values, constraints)
+                    entry_ids.append(entry_id)
+                    if entry_id in self.offsets or entry_id in new_offsets:
+                        continue
+
+                    entry = {'id': entry_id, 'board': board_values, 'constraints': normalize_constraints(constraints)}
+                    entry.update(metadata)
+                    line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+                    store_file.write(line)
+                    new_offsets[entry_id] = offset
+                    offset += len(line)
+
+                store_file.flush()
+                os.fsync(store_file.fileno())
+        except (OSError, TypeError, ValueError) as e:
+            raise PuzzleStoreError(f"Could not save to {self.path}: {e}") from e
+
+        #Only index the new puzzles once they are safely on disk
+        for entry_id, entry_offset in new_offsets.items():
+            self.offsets[entry_id] = entry_offset
+            self.ids.append(entry_id)
+        self.valid_length = offset
+        return entry_ids
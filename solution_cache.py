@@ -0,0 +1,247 @@
+import hashlib
+import itertools
+import json
+import os
+import sys
+
+from Constraints import BoxConstraint, ColumnConstraint, RowConstraint
+
+#Persistent cache of solved puzzles, consulted by solver.solve before it searches:
+#   cache = SolutionCache("solution_cache.jsonl", symmetry=True)
+#   solver.solve(sudoku_board, cache=cache)
+#Puzzles are keyed by a hash of their givens and variant constraints. With symmetry on, classic puzzles are first
+#brought into a canonical form under the Sudoku symmetries (transposing, permuting bands, stacks and the rows and
+#columns inside them, relabelling digits), so every puzzle equivalent to a solved one is a hit as well.
+#Entries are appended to the file one JSON line at a time; a line cut short by a crash is skipped when loading.
+#If the file cannot be read or written the cache carries on in memory only, a solve never fails because of it.
+
+#Next to the module, so the same cache is used whatever the working directory is
+SOLUTION_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solution_cache.jsonl")
+
+#Canonical forms are searched exhaustively up to this many candidate transformations. Puzzles with very few givens
+#tie on more than that and are keyed by the first candidate, which is still correct but can miss equivalent puzzles
+MAX_CANONICAL_CANDIDATES = 5000
+
+#Below the 17 givens every unique classic puzzle needs, nearly all transformations tie and the search gets slow,
+#such puzzles are keyed as they are
+MIN_CANONICAL_GIVENS = 17
+
+CLASSIC_CONSTRAINTS = (RowConstraint, ColumnConstraint, BoxConstraint)
+
+#Statistics kept with every entry, copied into the SolverStats of a solve that hits it
+CACHED_STATS = ('nodes', 'max_depth', 'backtracks', 'propagations')
+
+
+def _sorted_columns(pattern, rows):
+    #The column order giving the lexicographically smallest pattern over rows, read row by row.
+    #Columns are sorted by their vectors inside each stack and the stacks by their blocks, which is exact because
+    #the first row where two columns (or two blocks) differ decides the comparison of the whole string.
+    #Returns (prefix, column order, stacks as (block, sorted columns) in order)
+    stacks = []
+    for stack in range(3):
+        columns = sorted(range(stack * 3, stack * 3 + 3), key=lambda col: tuple(pattern[row * 9 + col] for row in rows))
+        block = tuple(tuple(pattern[row * 9 + col] for col in columns) for row in rows)
+        stacks.append((block, columns))
+    stacks.sort(key=lambda stack: stack[0])
+
+    column_order = [col for _, columns in stacks for col in columns]
+    prefix = tuple(pattern[row * 9 + col] for row in rows for col in column_order)
+    return prefix, column_order, stacks
+
+
+def _tied_column_orders(pattern, stacks):
+    #Every column order giving the same pattern as the sorted one: equal columns inside a stack, and stacks with
+    #equal blocks, can be swapped
+    stack_choices = []
+    for _, columns in stacks:
+        runs = [list(group) for _, group in itertools.groupby(columns, key=lambda col: tuple(pattern[col::9]))]
+        stack_choices.append([
+            [col for run in ordering for col in run]
+            for ordering in itertools.product(*(itertools.permutations(run) for run in runs))
+        ])
+
+    for choice in itertools.product(*stack_choices):
+        stack_runs = [list(group) for _, group in itertools.groupby(range(3), key=lambda slot: stacks[slot][0])]
+        for ordering in itertools.product(*(itertools.permutations(run) for run in stack_runs)):
+            yield [col for run in ordering for slot in run for col in choice[slot]]
+
+
+def _apply(values, transpose, row_order, col_order):
+    if transpose:
+        return [values[col_order[col] * 9 + row_order[row]] for row in range(9) for col in range(9)]
+    return [values[row_order[row] * 9 + col_order[col]] for row in range(9) for col in range(9)]
+
+
+def _relabel(values):
+    #Digits renumbered in order of first appearance, returns (relabelled values, original digit per new digit).
+    #Digits missing from the givens take the remaining numbers in order, they are interchangeable in the puzzle
+    mapping = {0: 0}
+    for value in values:
+        if value not in mapping:
+            mapping[value] = len(mapping)
+    for digit in range(1, 10):
+        if digit not in mapping:
+            mapping[digit] = len(mapping)
+    inverse = [0] * 10
+    for digit, new_digit in mapping.items():
+        inverse[new_digit] = digit
+    return [mapping[value] for value in values], inverse
+
+
+def canonical_transform(values):
+    #(transpose, row order, column order) mapping a classic puzzle to its canonical form: the smallest pattern of
+    #givens, and among those the smallest relabelled digits.
+    #Rows are chosen one at a time, only keeping the partial orders whose best pattern so far is still the smallest
+    pattern = [0 if value else 1 for value in values]
+    best_prefix = None
+    candidates = []
+    for transpose in (False, True):
+        grid = pattern if not transpose else [pattern[col * 9 + row] for row in range(9) for col in range(9)]
+        partials = [()]
+        for depth in range(9):
+            extended = []
+            for rows in partials:
+                if depth % 3 == 0:
+                    used_bands = set(row // 3 for row in rows)
+                    options = [row for row in range(9) if row // 3 not in used_bands]
+                else:
+                    band = rows[-1] // 3
+                    options = [row for row in range(band * 3, band * 3 + 3) if row not in rows]
+                for row in options:
+                    new_rows = rows + (row,)
+                    extended.append((_sorted_columns(grid, new_rows)[0], new_rows))
+
+            level_best = min(prefix for prefix, _ in extended)
+            partials = [rows for prefix, rows in extended if prefix == level_best]
+
+        prefix = level_best
+        if best_prefix is None or prefix < best_prefix:
+            best_prefix = prefix
+            candidates = []
+        if prefix == best_prefix:
+            candidates.extend((transpose, rows, grid) for rows in partials)
+
+    best = None
+    evaluated = 0
+    for transpose, rows, grid in candidates:
+        _, _, stacks = _sorted_columns(grid, rows)
+        for col_order in _tied_column_orders(grid, stacks):
+            relabelled, _ = _relabel(_apply(values, transpose, rows, col_order))
+            if best is None or relabelled < best[0]:
+                best = (relabelled, (transpose, list(rows), col_order))
+            evaluated += 1
+            if evaluated >= MAX_CANONICAL_CANDIDATES:
+                return best[1]
+    return best[1]
+
+
+def is_classic(sudoku_board):
+    return all(isinstance(constraint, CLASSIC_CONSTRAINTS) for constraint in sudoku_board.constraints)
+
+
+class PuzzleEncoding():
+    #Cache key of a board, plus what is needed to map a canonical solution back onto it
+    def __init__(self, sudoku_board, symmetry=False):
+        self.transform = None
+        self.inverse_labels = None
+        values = list(sudoku_board.values)
+
+        if symmetry and 81 - sudoku_board.empty_count >= MIN_CANONICAL_GIVENS and is_classic(sudoku_board):
+            self.transform = canonical_transform(values)
+            values, self.inverse_labels = _relabel(_apply(values, *self.transform))
+            variant = 'canonical'
+        else:
+            variant = ';'.join(sorted(
+                ','.join(map(str, constraint.cache_key()))
+                for constraint in sudoku_board.constraints
+                if not isinstance(constraint, CLASSIC_CONSTRAINTS)
+            ))
+
+        text = ''.join(map(str, values)) + '|' + variant
+        self.key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def to_key_values(self, values):
+        #Board values into the cached form
+        if self.transform is None:
+            return list(values)
+        labels = [0] * 10
+        for new_digit, digit in enumerate(self.inverse_labels):
+            labels[digit] = new_digit
+        return [labels[value] for value in _apply(values, *self.transform)]
+
+    def from_key_values(self, key_values):
+        #Inverse of to_key_values, maps a cached solution back onto the board
+        if self.transform is None:
+            return list(key_values)
+        transpose, row_order, col_order = self.transform
+        values = [0] * 81
+        for row in range(9):
+            for col in range(9):
+                digit = self.inverse_labels[key_values[row * 9 + col]]
+                if transpose:
+                    values[col_order[col] * 9 + row_order[row]] = digit
+                else:
+                    values[row_order[row] * 9 + col_order[col]] = digit
+        return values
+
+
+class SolutionCache():
+    #path None keeps the cache in memory only
+    def __init__(self, path=SOLUTION_CACHE_FILE, symmetry=False):
+        self.path = path
+        self.symmetry = symmetry
+        self.entries = {} #Key -> (solution values or None if unsolvable, stats dict)
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as cache_file:
+                for line in cache_file:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    solution = entry['solution']
+                    self.entries[entry['key']] = ([int(char) for char in solution] if solution else None, entry['stats'])
+        except OSError as e:
+            self.disable_file(e)
+
+    def disable_file(self, error):
+        #Keep caching in memory only, the file is not touched again
+        print(f"Solution cache {self.path} is unavailable, caching in memory only: {error}", file=sys.stderr)
+        self.path = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def encode(self, sudoku_board):
+        return PuzzleEncoding(sudoku_board, self.symmetry)
+
+    def lookup(self, encoding):
+        #(solution values or None if the puzzle has no solution, stats dict), or None on a miss
+        entry = self.entries.get(encoding.key)
+        if entry is None:
+            return None
+        solution, stats = entry
+        return (encoding.from_key_values(solution) if solution is not None else None), stats
+
+    def store(self, encoding, solution, stats=None):
+        #solution is the solved board's values, None for a puzzle without a solution
+        key_values = encoding.to_key_values(solution) if solution is not None else None
+        stats = {} if stats is None else {name: getattr(stats, name) for name in CACHED_STATS}
+        self.entries[encoding.key] = (key_values, stats)
+
+        if self.path is not None:
+            entry = {
+                'key': encoding.key,
+                'solution': ''.join(map(str, key_values)) if key_values is not None else None,
+                'stats': stats,
+            }
+            try:
+                with open(self.path, 'a') as cache_file:
+                    cache_file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            except OSError as e:
+                self.disable_file(e)
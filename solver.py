@@ -1,42 +1,264 @@
-import copy
+import time
 
+import DancingLinks
+from bitmask_utils import MASK_DIGITS
 from enums import *
+from solver_events import NULL_EVENT_SINK
+from solver_budget import SolveBudget, SolveResult
+from solver_stats import SolverStats
+from Strategies import create_default_pipeline
 
 
-def solve(sudoku_board, state_update_callback, cell_update_callback):
-    state_update_callback(GUIState.SOLVING)
+def solve(sudoku_board, event_sink=None, strategies=None, engine=SolverEngineEnum.BACKTRACKING, cancel_event=None, stats=None,
+          heuristic=None, cache=None, budget=None):
+    #event_sink receives state changes and cell updates (see solver_events), nothing is reported when None
+    #strategies is a StrategyPipeline run between branching steps, the default pipeline is used when None
+    #engine selects the search algorithm, see SolverEngineEnum
+    #cancel_event is an optional threading.Event, the search gives up as soon as it is set
+    #stats is an optional SolverStats that the search counters are added to
+    #heuristic is an optional CellHeuristic (see Heuristics) picking the cell to branch on, MRV when None
+    #cache is an optional SolutionCache (see solution_cache) checked before searching and filled in afterwards
+    #budget is an optional SolveBudget (see solver_budget) stopping the search at its limits, see solve_with_budget
+    if event_sink is None:
+        event_sink = NULL_EVENT_SINK
+
+    event_sink.state_changed(GUIState.SOLVING)
+
+    start = time.perf_counter()
+    encoding = cache.encode(sudoku_board) if cache is not None else None
+    cached = cache.lookup(encoding) if cache is not None else None
+    if cached is not None:
+        final_board = cached_solve(sudoku_board, cached, event_sink, stats)
+    else:
+        sudoku_board_copy = sudoku_board.clone()
+        sudoku_board_copy.stats = stats
+        sudoku_board_copy.heuristic = heuristic
+        if budget is not None:
+            #The budget reads the node count from the stats and stands in for the cancel event
+            if stats is None:
+                stats = sudoku_board_copy.stats = SolverStats()
+            budget.start(sudoku_board_copy, cancel_event)
+            cancel_event = budget
+        if engine == SolverEngineEnum.DANCING_LINKS:
+            final_board = dancing_links_solve(sudoku_board_copy, event_sink, cancel_event)
+        else:
+            if strategies is None:
+                strategies = create_default_pipeline()
+            #Every constraint is checked once up front, givens that already break one make the puzzle unsolvable
+            final_board = None
+            if sudoku_board_copy.propagate(sudoku_board_copy.constraints):
+                final_board = recursive_solve(sudoku_board_copy, event_sink, strategies, cancel_event)
+        if budget is not None:
+            budget.stop()
+
+        #A cancelled search proves nothing about the puzzle
+        if cache is not None and not (cancel_event is not None and cancel_event.is_set()):
+            cache.store(encoding, final_board.values if final_board else None, stats)
+    if stats is not None:
+        stats.time_spent += time.perf_counter() - start
 
-    sudoku_board_copy = copy.deepcopy(sudoku_board)
-    final_board = recursive_solve(sudoku_board_copy, cell_update_callback)
     if final_board:
-        state_update_callback(GUIState.SOLVED)
+        event_sink.state_changed(GUIState.SOLVED)
+    elif cancel_event is not None and cancel_event.is_set():
+        event_sink.state_changed(GUIState.SOLVE_CANCELLED)
     else:
-        state_update_callback(GUIState.INCORRECT_SOLVE)
+        event_sink.state_changed(GUIState.INCORRECT_SOLVE)
     return final_board
 
 
-def recursive_solve(sudoku_board, cell_update_callback):
+def solve_with_stats(sudoku_board, **kwargs):
+    #Same as solve, returns (solved board or None, SolverStats)
+    stats = SolverStats()
+    return solve(sudoku_board, stats=stats, **kwargs), stats
+
+
+def solve_with_budget(sudoku_board, time_limit=None, node_limit=None, memory_limit=None, **kwargs):
+    #Same as solve with the search limited to time_limit seconds, node_limit nodes and memory_limit bytes of undo
+    #trail (None for no limit). Returns a SolveResult (see solver_budget) telling whether the puzzle was solved,
+    #has no solution or the search was cut off, with the most filled in assignment reached and the stats at cutoff
+    budget = SolveBudget(time_limit, node_limit, memory_limit)
+    stats = kwargs.pop('stats', None) or SolverStats()
+    final_board = solve(sudoku_board, stats=stats, budget=budget, **kwargs)
+
+    if final_board:
+        return SolveResult(SolveStatusEnum.SOLVED, final_board, list(final_board.values), stats)
+    if budget.exhausted is None:
+        #A cache hit never starts the budget
+        return SolveResult(SolveStatusEnum.UNSATISFIABLE, None, budget.best_values or list(sudoku_board.values), stats)
+    status = SolveStatusEnum.CANCELLED if budget.exhausted == 'cancelled' else SolveStatusEnum.BUDGET_EXHAUSTED
+    return SolveResult(status, None, budget.best_values, stats, budget.exhausted)
+
+
+def count_solutions(sudoku_board, limit=2, strategies=None, engine=None, budget=None):
+    #Number of solutions of the board, the search stops as soon as limit is reached so limit=2 is a uniqueness check.
+    #engine None picks dancing links when the board only has constraints it supports, it is the faster counter.
+    #budget is an optional SolveBudget, when budget.exhausted is set afterwards the count is only a lower bound
+    if engine is None:
+        engine = SolverEngineEnum.DANCING_LINKS if DancingLinks.is_supported(sudoku_board) else SolverEngineEnum.BACKTRACKING
+    if engine == SolverEngineEnum.DANCING_LINKS and budget is None:
+        return DancingLinks.count_solutions(sudoku_board, limit)
+
+    #The budget reads the node count from the stats of the board it watches
+    board = sudoku_board.clone()
+    if budget is not None:
+        board.stats = SolverStats()
+        budget.start(board)
+    if engine == SolverEngineEnum.DANCING_LINKS:
+        count = DancingLinks.count_solutions(board, limit, cancel_event=budget)
+    else:
+        if strategies is None:
+            strategies = create_default_pipeline()
+        count = recursive_count(board, limit, strategies, cancel_event=budget) if board.propagate(board.constraints) else 0
+    if budget is not None:
+        budget.stop()
+    return count
+
+
+def cached_solve(sudoku_board, cached, event_sink=NULL_EVENT_SINK, stats=None):
+    #Fill in a solution found in a SolutionCache, None if the cache knows the puzzle has no solution
+    solution, cached_stats = cached
+    if stats is not None:
+        stats.cache_hit = True
+        for name, value in cached_stats.items():
+            if name == 'max_depth':
+                stats.max_depth = max(stats.max_depth, value)
+            else:
+                setattr(stats, name, getattr(stats, name) + value)
+    if solution is None:
+        return None
+
+    sudoku_board_copy = sudoku_board.clone()
+    placed = []
+    for index, value in enumerate(solution):
+        if sudoku_board_copy.values[index] == 0:
+            sudoku_board_copy.place_value(index, value)
+            placed.append(index)
+
+    if event_sink.listening:
+        report_cells(sudoku_board_copy, placed, event_sink)
+    return sudoku_board_copy
+
+
+def dancing_links_solve(sudoku_board, event_sink=NULL_EVENT_SINK, cancel_event=None):
+    #Raises ValueError if the board has constraints the exact cover encoding does not support
+    solutions = DancingLinks.find_solutions(sudoku_board, limit=1, stats=sudoku_board.stats, cancel_event=cancel_event)
+    if not solutions:
+        return None
+
+    placed = []
+    for index, value in enumerate(solutions[0]):
+        if sudoku_board.values[index] == 0:
+            sudoku_board.place_value(index, value)
+            placed.append(index)
+
+    if event_sink.listening:
+        report_cells(sudoku_board, placed, event_sink)
+    return sudoku_board
+
+
+def report_cells(sudoku_board, indices, event_sink, clear=False):
+    if indices:
+        cells = sudoku_board.cells
+        event_sink.cells_changed([(cells[index].row, cells[index].col, 0 if clear else cells[index].value) for index in indices])
+
+
+def recursive_solve(sudoku_board, event_sink=NULL_EVENT_SINK, strategies=None, cancel_event=None, depth=0):
     if sudoku_board.is_solved():
         return sudoku_board
 
-    least_cell = sudoku_board.find_least_num_possible_cell()
-    possible_values = least_cell.possible_values.copy()
+    if cancel_event is not None and cancel_event.is_set():
+        return None
+
+    stats = sudoku_board.stats
+    if stats is not None:
+        stats.nodes += 1
+        if depth > stats.max_depth:
+            stats.max_depth = depth
+
+    #Only spend time on reporting when somebody is listening
+    listening = event_sink.listening
+    if listening:
+        event_sink.node_visited()
+
+    #Logical deductions first, they are far cheaper than branching
+    deduced = []
+    if strategies is not None:
+        mark = sudoku_board.mark()
+        consistent = strategies.run(sudoku_board)
+        if listening:
+            deduced = sudoku_board.placed_since(mark)
+            report_cells(sudoku_board, deduced, event_sink)
 
-    #If it has 0 possible values -> backtrack
-    if len(possible_values) == 0:
+        if not consistent:
+            if listening:
+                report_cells(sudoku_board, deduced, event_sink, clear=True)
+            return None
+        if sudoku_board.is_solved():
+            return sudoku_board
+
+    least_cell = sudoku_board.select_cell()
+    if least_cell is None:
+        #Board is full but breaks a constraint -> backtrack
+        if listening:
+            report_cells(sudoku_board, deduced, event_sink, clear=True)
         return None
+    possible_values = MASK_DIGITS[least_cell.candidates]
 
-    #Try each possible value
+    #Try each possible value, rolling the board back through its trail on failure
+    #If it has 0 possible values the loop is skipped -> backtrack
     for value in possible_values:
+        mark = sudoku_board.mark()
+
+        #Propagates to fixpoint and fills in any naked singles it produces
+        consistent = sudoku_board.assign(least_cell.index, value)
+        if listening:
+            placed = sudoku_board.placed_since(mark)
+            report_cells(sudoku_board, placed, event_sink)
+
+        if consistent:
+            solved_board = recursive_solve(sudoku_board, event_sink, strategies, cancel_event, depth + 1)
+            if solved_board:
+                return solved_board
+
+        sudoku_board.undo(mark)
+        if stats is not None:
+            stats.backtracks += 1
+        if listening:
+            report_cells(sudoku_board, placed, event_sink, clear=True)
+
+    if listening:
+        report_cells(sudoku_board, deduced, event_sink, clear=True)
+    return None
+
+
+def recursive_count(sudoku_board, limit, strategies=None, cancel_event=None):
+    #Same search as recursive_solve, but every solution is counted and undone so the search carries on.
+    #If cancel_event is set the count so far is returned
+    if sudoku_board.is_solved():
+        return 1
+
+    if cancel_event is not None and cancel_event.is_set():
+        return 0
+
+    if sudoku_board.stats is not None:
+        sudoku_board.stats.nodes += 1
 
-        sudoku_board_copy = copy.deepcopy(sudoku_board)
-        least_cell = sudoku_board_copy.board[least_cell.row][least_cell.col]
+    if strategies is not None:
+        if not strategies.run(sudoku_board):
+            return 0
+        if sudoku_board.is_solved():
+            return 1
 
-        least_cell.set_value(value)
-        cell_update_callback(least_cell.row, least_cell.col, value)
+    cell = sudoku_board.select_cell()
+    if cell is None:
+        return 0
 
-        if recursive_solve(sudoku_board_copy, cell_update_callback):
-            return sudoku_board_copy
-        
-        least_cell.set_value(0)
-        cell_update_callback(least_cell.row, least_cell.col, 0)
\ No newline at end of file
+    count = 0
+    for value in MASK_DIGITS[cell.candidates]:
+        mark = sudoku_board.mark()
+        if sudoku_board.assign(cell.index, value):
+            count += recursive_count(sudoku_board, limit - count, strategies, cancel_event)
+        sudoku_board.undo(mark)
+        if count >= limit:
+            break
+    return count
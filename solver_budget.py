@@ -0,0 +1,90 @@
+import sys
+import time
+
+from enums import SolveStatusEnum
+
+#Limits on a single solve, for callers that need bounded latency more than an answer for every puzzle:
+#   result = solver.solve_with_budget(sudoku_board, time_limit=0.5, node_limit=100000)
+#   if result.status == SolveStatusEnum.BUDGET_EXHAUSTED: ...
+#The search checks the budget once per node, the same way it checks a cancel event.
+
+#Bytes per undo trail entry: the (index, value, candidates) tuple and its slot in the trail list.
+#Backtracking memory grows with the trail, everything else about a board has a fixed size
+TRAIL_ENTRY_BYTES = sys.getsizeof((0, 0, 0)) + 8
+
+
+class SolveBudget():
+    #Any limit left as None is not enforced. Node and memory limits apply to the backtracking engine,
+    #dancing links only stops for the time limit and the cancel event
+    def __init__(self, time_limit=None, node_limit=None, memory_limit=None):
+        self.time_limit = time_limit #Seconds of wall clock time
+        self.node_limit = node_limit #Search nodes
+        self.memory_limit = memory_limit #Bytes of undo trail
+
+        self.board = None
+        self.cancel_event = None
+        self.deadline = None
+        self.running = False #Limits are only checked between start and stop
+        self.exhausted = None #Name of the limit that ended the search, 'cancelled' if the cancel event did
+
+        #Most filled in assignment the search has reached
+        self.best_values = None
+        self.best_filled = -1
+
+    def start(self, sudoku_board, cancel_event=None):
+        #Called by solver.solve and count_solutions with the board they are about to search, which must have stats attached
+        self.board = sudoku_board
+        self.cancel_event = cancel_event
+        self.deadline = time.perf_counter() + self.time_limit if self.time_limit is not None else None
+        self.running = True
+        self.exhausted = None
+        self.best_values = list(sudoku_board.values)
+        self.best_filled = 81 - sudoku_board.empty_count
+
+    def stop(self):
+        #Called once the search has returned. A search that finished at its last allowed node was not cut off,
+        #so later is_set calls only report whether a limit ended it
+        self.running = False
+
+    def is_set(self):
+        #Works like threading.Event.is_set for the search: True once a limit has been hit
+        if self.exhausted is not None or not self.running:
+            return self.exhausted is not None
+
+        board = self.board
+        filled = 81 - board.empty_count
+        if filled > self.best_filled:
+            self.best_filled = filled
+            self.best_values = list(board.values)
+
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self.exhausted = 'cancelled'
+        elif self.node_limit is not None and board.stats.nodes >= self.node_limit:
+            self.exhausted = 'nodes'
+        elif self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.exhausted = 'time'
+        elif self.memory_limit is not None and board.trail is not None \
+                and len(board.trail) * TRAIL_ENTRY_BYTES >= self.memory_limit:
+            self.exhausted = 'memory'
+        return self.exhausted is not None
+
+
+class SolveResult():
+    def __init__(self, status, board, partial_values, stats, exhausted_limit=None):
+        self.status = status #SolveStatusEnum
+        self.board = board #Solved SudokuBoard, None unless status is SOLVED
+        self.partial_values = partial_values #Flat 81 values: the solution, or the most filled in assignment reached
+        self.stats = stats #SolverStats of the solve
+        self.exhausted_limit = exhausted_limit #'time', 'nodes', 'memory' or 'cancelled' when the search was cut off
+
+    @property
+    def solved(self):
+        return self.status == SolveStatusEnum.SOLVED
+
+    def as_dict(self):
+        return {
+            'status': self.status.value,
+            'exhausted_limit': self.exhausted_limit,
+            'partial_values': self.partial_values,
+            'stats': self.stats.as_dict(),
+        }
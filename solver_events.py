@@ -0,0 +1,82 @@
+import time
+
+#Event sinks receive progress from the solver. The solver checks listening once per node and skips all
+#of its reporting work when nobody listens, so the default NULL_EVENT_SINK costs nothing in the hot loop.
+
+
+class SolverEventSink():
+    #Ignores every event, subclasses that consume cell updates set listening = True
+    listening = False
+
+    def state_changed(self, state):
+        #Called with a GUIState when the solver starts and finishes
+        pass
+
+    def node_visited(self):
+        #Called once per search node while listening
+        pass
+
+    def cells_changed(self, updates):
+        #Called with a list of (row, col, value) tuples, value 0 when a cell is cleared on backtrack
+        pass
+
+    def flush(self):
+        #Deliver anything that is being held back
+        pass
+
+
+NULL_EVENT_SINK = SolverEventSink()
+
+
+class CallbackEventSink(SolverEventSink):
+    #Forwards events to plain callbacks, either one may be None
+    def __init__(self, state_update_callback=None, cells_update_callback=None):
+        self.state_update_callback = state_update_callback
+        self.cells_update_callback = cells_update_callback
+        self.listening = cells_update_callback is not None
+
+    def state_changed(self, state):
+        if self.state_update_callback is not None:
+            self.state_update_callback(state)
+
+    def cells_changed(self, updates):
+        if self.cells_update_callback is not None:
+            self.cells_update_callback(updates)
+
+
+class ThrottledEventSink(SolverEventSink):
+    #Coalesces cell updates (latest value per cell wins) and passes them on to another sink
+    #at most every every_nodes search nodes or every interval seconds, whichever comes first
+    def __init__(self, sink, every_nodes=None, interval=None):
+        self.sink = sink
+        self.every_nodes = every_nodes
+        self.interval = interval
+        self.listening = sink.listening
+
+        self.pending = {}
+        self.nodes_since_flush = 0
+        self.last_flush_time = time.perf_counter()
+
+    def state_changed(self, state):
+        self.flush()
+        self.sink.state_changed(state)
+
+    def node_visited(self):
+        self.nodes_since_flush += 1
+        if self.every_nodes is not None and self.nodes_since_flush >= self.every_nodes:
+            self.flush()
+        elif self.interval is not None and time.perf_counter() - self.last_flush_time >= self.interval:
+            self.flush()
+
+    def cells_changed(self, updates):
+        for row, col, value in updates:
+            self.pending[(row, col)] = value
+
+    def flush(self):
+        self.nodes_since_flush = 0
+        self.last_flush_time = time.perf_counter()
+        if self.pending:
+            updates = [(row, col, value) for (row, col), value in self.pending.items()]
+            self.pending = {}
+            self.sink.cells_changed(updates)
+        self.sink.flush()
@@ -0,0 +1,73 @@
+import time
+
+#Search counters filled in by the solver when a SolverStats is passed to solver.solve.
+#The board holds a reference while a solve runs, every hook is skipped when it is None.
+
+
+class ConstraintTypeStats():
+    #Totals for every constraint of one class, e.g. all KropkiDotConstraints of the board
+    def __init__(self):
+        self.propagate_calls = 0
+        self.propagate_time = 0.0
+        self.eliminations = 0 #Candidates removed by propagate()
+        self.verify_calls = 0
+        self.verify_time = 0.0
+
+    def as_dict(self):
+        return {
+            'propagate_calls': self.propagate_calls,
+            'propagate_time': self.propagate_time,
+            'eliminations': self.eliminations,
+            'verify_calls': self.verify_calls,
+            'verify_time': self.verify_time,
+        }
+
+
+class SolverStats():
+    def __init__(self):
+        self.nodes = 0 #Search nodes visited
+        self.max_depth = 0 #Deepest guess, 0 if the puzzle was solved without guessing
+        self.backtracks = 0 #Guesses that were undone
+        self.propagations = 0 #Calls to SudokuBoard.propagate
+        self.time_spent = 0.0
+        self.cache_hit = False #True if the solution came from a SolutionCache, the counters are then those of the cached solve
+
+        #Candidates removed by set_candidates, used to attribute eliminations to the constraint that made them
+        self.candidates_removed = 0
+        self.constraint_types = {}
+
+    def constraint_type(self, constraint):
+        name = type(constraint).__name__
+        type_stats = self.constraint_types.get(name)
+        if type_stats is None:
+            type_stats = self.constraint_types[name] = ConstraintTypeStats()
+        return type_stats
+
+    def measure_propagate(self, constraint):
+        type_stats = self.constraint_type(constraint)
+        removed_before = self.candidates_removed
+        start = time.perf_counter()
+        result = constraint.propagate()
+        type_stats.propagate_time += time.perf_counter() - start
+        type_stats.propagate_calls += 1
+        type_stats.eliminations += self.candidates_removed - removed_before
+        return result
+
+    def measure_verify(self, constraint):
+        type_stats = self.constraint_type(constraint)
+        start = time.perf_counter()
+        result = constraint.verify_constraint()
+        type_stats.verify_time += time.perf_counter() - start
+        type_stats.verify_calls += 1
+        return result
+
+    def as_dict(self):
+        return {
+            'nodes': self.nodes,
+            'max_depth': self.max_depth,
+            'backtracks': self.backtracks,
+            'propagations': self.propagations,
+            'time_spent': self.time_spent,
+            'cache_hit': self.cache_hit,
+            'constraint_types': {name: type_stats.as_dict() for name, type_stats in self.constraint_types.items()},
+        }
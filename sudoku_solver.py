@@ -0,0 +1,197 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import batch_solver
+import DancingLinks
+import parallel_solver
+import predefined_sudoku_utils
+import puzzle_format
+import solver
+from enums import SolverEngineEnum
+
+#Headless entry point for solving many puzzles at once:
+#   python -m sudoku_solver solve puzzles.txt --workers 8
+#Puzzles are read one per line in the line format of puzzle_format (81 characters, 0 or . for empty cells,
+#optionally followed by constraints) and the solutions are written to stdout in the same order, one per line.
+#A line that cannot be parsed gets an invalid line in the output, so one bad puzzle does not stop the run.
+
+UNSOLVED_LINE = "unsolvable"
+INVALID_LINE = "invalid"
+
+
+def read_puzzle_lines(path):
+    #Yield puzzle lines lazily so huge files are never loaded whole, - reads stdin
+    puzzle_file = sys.stdin if path == '-' else open(path, 'r')
+    try:
+        for line in puzzle_file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+    finally:
+        if puzzle_file is not sys.stdin:
+            puzzle_file.close()
+
+
+def parse_puzzle_board(line):
+    #SudokuBoard of a puzzle line, None if the line is malformed (the reason is printed to stderr)
+    try:
+        board_values, constraints = puzzle_format.parse_puzzle_line(line)
+        return predefined_sudoku_utils.create_sudoku_board(board_values, constraints)
+    except ValueError as e:
+        print(f"Invalid puzzle line {line!r}: {e}", file=sys.stderr)
+        return None
+
+
+def solve_puzzle_line(line, engine):
+    sudoku_board = parse_puzzle_board(line)
+    if sudoku_board is None:
+        return INVALID_LINE
+    if engine == SolverEngineEnum.DANCING_LINKS and not DancingLinks.is_supported(sudoku_board):
+        #Variants dancing links cannot encode, such as Kropki dots, are solved by backtracking instead
+        engine = SolverEngineEnum.BACKTRACKING
+    solved_board = solver.solve(sudoku_board, engine=engine)
+    if not solved_board:
+        return UNSOLVED_LINE
+    return predefined_sudoku_utils.format_sudoku_line(solved_board.values)
+
+
+def solve_puzzle_chunk(lines, engine_value, batch=False):
+    #Runs in a worker process, the engine is passed by value so it pickles cheaply
+    engine = SolverEngineEnum(engine_value)
+    if not batch:
+        return [solve_puzzle_line(line, engine) for line in lines]
+
+    #Classic puzzles of the chunk are solved together by the batch engine, variants one at a time
+    results = [None] * len(lines)
+    classic_positions = []
+    classic_values = []
+    for position, line in enumerate(lines):
+        try:
+            board_values, constraints = puzzle_format.parse_puzzle_line(line)
+        except ValueError as e:
+            print(f"Invalid puzzle line {line!r}: {e}", file=sys.stderr)
+            results[position] = INVALID_LINE
+            continue
+        if constraints:
+            results[position] = solve_puzzle_line(line, engine)
+        else:
+            classic_positions.append(position)
+            classic_values.append([value for row in board_values for value in row])
+
+    for position, solution in zip(classic_positions, batch_solver.solve_batch(classic_values, engine)):
+        results[position] = predefined_sudoku_utils.format_sudoku_line(solution) if solution else UNSOLVED_LINE
+    return results
+
+
+def chunked(lines, chunk_size):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def split_solve_puzzle_line(line, workers):
+    sudoku_board = parse_puzzle_board(line)
+    if sudoku_board is None:
+        return INVALID_LINE
+    solved_board = parallel_solver.parallel_solve(sudoku_board, workers=workers)
+    if not solved_board:
+        return UNSOLVED_LINE
+    return predefined_sudoku_utils.format_sudoku_line(solved_board.values)
+
+
+def solve_puzzles(lines, engine=SolverEngineEnum.BACKTRACKING, workers=None, chunk_size=64, batch=False, split=False):
+    #Yield solution lines in input order. Chunks are submitted to the pool as the input is read,
+    #with a bounded number in flight so memory stays flat however many puzzles there are.
+    #batch solves the classic puzzles of each chunk with batch_solver, split solves one puzzle at a time
+    #with its search tree spread over the workers (see parallel_solver)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if split:
+        for line in lines:
+            yield split_solve_puzzle_line(line, workers)
+        return
+
+    if workers == 1:
+        for chunk in chunked(lines, chunk_size):
+            yield from solve_puzzle_chunk(chunk, engine.value, batch)
+        return
+
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunked(lines, chunk_size):
+            pending.append(executor.submit(solve_puzzle_chunk, chunk, engine.value, batch))
+            if len(pending) >= max_in_flight:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def print_throughput(solved, total, start_time):
+    elapsed = time.perf_counter() - start_time
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"{solved}/{total} puzzles solved in {elapsed:.2f}s ({rate:.1f} puzzles/s)", file=sys.stderr)
+
+
+def solve_command(args):
+    engine = SolverEngineEnum(args.engine)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+
+    solved = 0
+    total = 0
+    start_time = time.perf_counter()
+    try:
+        for solution_line in solve_puzzles(read_puzzle_lines(args.puzzles), engine, args.workers, args.chunk_size,
+                                                   args.batch, args.split):
+            output.write(solution_line + '\n')
+            total += 1
+            if solution_line not in (UNSOLVED_LINE, INVALID_LINE):
+                solved += 1
+            if args.report_every and total % args.report_every == 0:
+                print_throughput(solved, total, start_time)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print_throughput(solved, total, start_time)
+    return 0 if solved == total else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='sudoku_solver', description="Headless Sudoku solver")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    solve_parser = subparsers.add_parser('solve', help="Solve every puzzle in a file, one per line")
+    solve_parser.add_argument('puzzles', help="Puzzle file, - for stdin")
+    solve_parser.add_argument('-o', '--output', default='-', help="Where to write the solutions, - for stdout")
+    solve_parser.add_argument('-e', '--engine', default=SolverEngineEnum.BACKTRACKING.value,
+                              choices=[engine.value for engine in SolverEngineEnum])
+    solve_parser.add_argument('-w', '--workers', type=int, default=None, help="Worker processes, defaults to the CPU count")
+    solve_parser.add_argument('-c', '--chunk-size', type=int, default=64, help="Puzzles sent to a worker at a time")
+    solve_parser.add_argument('--batch', action='store_true',
+                              help="Solve classic puzzles a chunk at a time with the NumPy batch engine, use a larger --chunk-size")
+    solve_parser.add_argument('--split', action='store_true',
+                              help="Solve one puzzle at a time with its search tree split over the workers, for very hard puzzles")
+    solve_parser.add_argument('--report-every', type=int, default=0, help="Print throughput every N puzzles")
+    solve_parser.set_defaults(handler=solve_command)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())